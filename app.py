@@ -1,8 +1,66 @@
+import os
+import uuid
 import streamlit as st
-import time
 
+import session_store
 # Import the respond function from our existing chatbot script
-from travel_chatbot import respond
+from travel_chatbot import respond, Session, GREETING
+
+# How the bot's reply shows up (set TRAVEL_TYPING_MODE to change it):
+#   "stream" - streamed word by word with st.write_stream, no server-side sleeps
+#   "fade"   - rendered at once and faded in by the browser with CSS
+#   "off"    - rendered at once
+TYPING_MODE = os.environ.get("TRAVEL_TYPING_MODE", "stream").strip().lower()
+
+# Only the latest few messages get their own chat bubble. Everything older
+# (up to the store's history limit) is folded into one markdown block, so a
+# rerun doesn't redraw one element per message for the whole conversation.
+RECENT_MESSAGES = int(os.environ.get("TRAVEL_RECENT_MESSAGES", "6"))
+
+# Conversations live in a session store rather than in st.session_state, so
+# with TRAVEL_SESSION_DB pointing at a shared SQLite file, any of several
+# Streamlit servers behind a load balancer can carry on a conversation.
+# The session id travels in the URL (?session=...).
+SESSION_DB = os.environ.get("TRAVEL_SESSION_DB")
+
+@st.cache_resource
+def get_store():
+    """
+    One store per server process, shared by every browser session.
+    """
+    return session_store.open_store(SESSION_DB)
+
+def stream_words(text):
+    """
+    Yields the reply one word at a time for st.write_stream.
+    """
+    for word in text.split(" "):
+        yield word + " "
+
+def archive_line(role, content):
+    """
+    One message formatted for the folded history block.
+    """
+    speaker = "You" if role == "user" else "Bot"
+    return f"**{speaker}:** {content}\n\n"
+
+def folded_history(archived):
+    """
+    The folded history block for the `archived` messages. The block is kept
+    in st.session_state between reruns: messages the store has trimmed off
+    the front are cut from it, and only messages new to it are formatted.
+    If the history changed some other way (say another tab wrote to the
+    same conversation), it is built again from scratch.
+    """
+    archived = tuple(archived)
+    kept, text = st.session_state.get("archive", ((), ""))
+    start = 0
+    while start < len(kept) and kept[start:] != archived[:len(kept) - start]:
+        text = text[len(archive_line(*kept[start])):]
+        start += 1
+    text += "".join(archive_line(role, content) for role, content in archived[len(kept) - start:])
+    st.session_state.archive = (archived, text)
+    return text
 
 # Set up the page configuration
 st.set_page_config(
@@ -23,42 +81,57 @@ You can use this chatbot to book **Flights** and **Hotels**.
 """)
 st.divider()
 
-# Initialize chat history in session state
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if TYPING_MODE == "fade":
+    # the animation runs entirely in the browser
+    st.markdown("""
+<style>
+[data-testid="stChatMessage"]:last-of-type { animation: reply-fade-in 0.6s ease-in; }
+@keyframes reply-fade-in { from { opacity: 0; } to { opacity: 1; } }
+</style>
+""", unsafe_allow_html=True)
+
+store = get_store()
+if "session_id" not in st.session_state:
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
+session_id = st.session_state.session_id
+
+# Dialogue state (which step of the booking funnel we're on) and chat
+# history, read fresh from the store on every rerun
+dialogue = Session(session_id)
+messages = store.load(session_id, dialogue)
+if messages is None:
     # Add initial bot greeting
-    st.session_state.messages.append({
-        "role": "assistant", 
-        "content": "Hello! I am your Travel Booking Assistant. Do you want to book a flight or a hotel today?"
-    })
+    messages = [("assistant", GREETING)]
+
+archived = max(0, len(messages) - RECENT_MESSAGES)
 
 # Display chat history on app rerun
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+if archived:
+    with st.expander(f"Earlier messages ({archived})"):
+        st.markdown(folded_history(messages[:archived]))
+
+for role, content in messages[archived:]:
+    with st.chat_message(role):
+        st.markdown(content)
 
 # React to user input
 if user_input := st.chat_input("Type your message here..."):
     # Display user message in chat message container
     with st.chat_message("user"):
         st.markdown(user_input)
-    
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": user_input})
 
     # Get Bot response using the imported `respond` function
-    reply = respond(user_input)
-    
-    # Display assistant response in chat message container with a slight delay for realism
+    reply = respond(user_input, dialogue)
+
+    # Display assistant response in chat message container
     with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        # Simulated typing effect
-        full_response = ""
-        for chunk in reply.split():
-            full_response += chunk + " "
-            time.sleep(0.05)
-            message_placeholder.markdown(full_response + "▌")
-        message_placeholder.markdown(full_response)
-        
-    # Add assistant response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": reply})
+        if TYPING_MODE == "stream":
+            st.write_stream(stream_words(reply))
+        else:
+            st.markdown(reply)
+
+    # Write the turn back; the store keeps only the last few dozen messages
+    messages.append(("user", user_input))
+    messages.append(("assistant", reply))
+    store.save(session_id, dialogue, messages)
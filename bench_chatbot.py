@@ -0,0 +1,541 @@
+import argparse
+import math
+import random
+import re
+import shutil
+import os
+import tempfile
+import threading
+import time
+
+import bookings
+import gazetteer
+import session_store
+import travel_chatbot
+
+# =======================================================================
+# Benchmarks for the Travel Booking Assistant
+# =======================================================================
+# Run everything:     python bench_chatbot.py
+# Run one section:    python bench_chatbot.py dispatch
+# Each section prints its own small report.
+# =======================================================================
+
+# Messages that hit one of the RULES (roughly the travel funnel)
+MATCHING_MESSAGES = [
+    "hi", "hello there", "good morning",
+    "book a flight to Paris", "I want a flight from London to Paris",
+    "find me a hotel in Lahore", "I want to book a hotel",
+    "luxury", "budget-friendly please", "hotel 2", "Hotel three",
+    "one way", "round trip", "economy", "business class",
+    "I want to travel tomorrow on a flight", "emirates airlines",
+    "3 rooms", "two tickets", "i want 4 seats", "5",
+    "Karachi", "new york", "you are useless", "bye",
+]
+
+# Messages that fall through every rule to DEFAULT_RESPONSES
+NON_MATCHING_MESSAGES = [
+    "what is the weather like?", "can you tell me a joke",
+    "12345 67890 !!", "is it possible to pay with a credit card, please?",
+    "how long does check-in take at the airport usually",
+    "qwertyuiop asdfghjkl zxcvbnm",
+]
+
+
+def long_messages(length=5000, count=5, seed=0):
+    """
+    Builds long filler inputs (think: a pasted itinerary) that only match
+    the catch-all rules late or not at all.
+    """
+    rng = random.Random(seed)
+    vocabulary = "the a of on with near and some many please maybe later check-in gate lounge".split()
+    messages = []
+    for _ in range(count):
+        words = []
+        while sum(len(w) + 1 for w in words) < length:
+            words.append(rng.choice(vocabulary))
+        messages.append(" ".join(words))
+    return messages
+
+
+def _clean(message):
+    return re.sub(r'[?!.]+$', '', message.strip())
+
+
+def _rate(func, messages, min_seconds=0.5):
+    """
+    Calls func on every message repeatedly for at least min_seconds and
+    returns the number of messages handled per second.
+    """
+    cleaned = [_clean(m) for m in messages]
+    handled = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_seconds:
+        for message in cleaned:
+            func(message)
+        handled += len(cleaned)
+        elapsed = time.perf_counter() - start
+    return handled / elapsed
+
+
+# =======================================================================
+# SECTION: dispatch
+# =======================================================================
+def bench_dispatch():
+    dispatcher = travel_chatbot.ACTIVE_RULES.dispatcher
+    long_inputs = long_messages()
+
+    # tests/test_dispatch.py checks that both give the same answers
+    print(f"{'input set':<14}{'linear msg/s':>16}{'combined msg/s':>18}{'speedup':>10}")
+    for label, messages in (
+        ("matching", MATCHING_MESSAGES),
+        ("non-matching", NON_MATCHING_MESSAGES),
+        ("long (5 KB)", long_inputs),
+    ):
+        linear = _rate(dispatcher.match_linear, messages)
+        combined = _rate(dispatcher.match, messages)
+        print(f"{label:<14}{linear:>16,.0f}{combined:>18,.0f}{combined / linear:>9.2f}x")
+
+
+# =======================================================================
+# SECTION: session
+# =======================================================================
+# one walk through each funnel, in the order a real user would type it
+FUNNEL_CONVERSATION = [
+    "hi", "I want to book a hotel", "Lahore", "luxury", "hotel 2", "3",
+    "book a flight", "Paris", "round trip", "economy", "2", "bye",
+]
+
+
+def bench_session():
+    def run(use_session):
+        session = travel_chatbot.Session() if use_session else None
+        for message in FUNNEL_CONVERSATION:
+            travel_chatbot.respond(message, session)
+
+    for label, use_session in (("stateless", False), ("with session", True)):
+        runs = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 0.5:
+            run(use_session)
+            runs += 1
+        elapsed = time.perf_counter() - start
+        print(f"{label:<14}{runs * len(FUNNEL_CONVERSATION) / elapsed:>12,.0f} turns/s")
+
+    # memory footprint of many idle sessions
+    import tracemalloc
+    count = 100_000
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [travel_chatbot.Session(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{count:,} sessions: {(after - before) / count:.0f} bytes/session (including the list slot)")
+    del sessions
+
+
+# =======================================================================
+# SECTION: render
+# =======================================================================
+def bench_render():
+    templates = [text for responses in travel_chatbot.ACTIVE_RULES.responses for text in responses]
+    parsed = [travel_chatbot.ResponseTemplate(text) for text in templates]
+    args = ["paris", "london"]
+    rounds = 2000
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in templates:
+            text.format(*args)
+    formatted = rounds * len(templates) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for template in parsed:
+            template.render(args)
+    rendered = rounds * len(parsed) / (time.perf_counter() - start)
+
+    print(f"str.format         {formatted:>12,.0f} renders/s")
+    print(f"pre-parsed render  {rendered:>12,.0f} renders/s")
+
+
+# =======================================================================
+# SECTION: cache
+# =======================================================================
+# what production traffic mostly looks like: a few short messages repeated
+HOT_MESSAGES = ["hi", "economy", "luxury", "2 rooms", "bye", "Hi!", "Economy.", "budget"]
+
+
+def bench_cache():
+    messages = HOT_MESSAGES * 50 + MATCHING_MESSAGES
+    random.shuffle(messages)
+
+    for label, size in (("no cache", 0), ("cache 1024", 1024)):
+        if size:
+            cache = travel_chatbot.enable_response_cache(size)
+        else:
+            travel_chatbot.disable_response_cache()
+        handled = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 0.5:
+            for message in messages:
+                travel_chatbot.respond(message)
+            handled += len(messages)
+        print(f"{label:<12}{handled / (time.perf_counter() - start):>12,.0f} msg/s")
+
+    print(f"cache stats: {cache.stats()}")
+    travel_chatbot.disable_response_cache()
+
+
+# =======================================================================
+# SECTION: metrics
+# =======================================================================
+def bench_metrics():
+    messages = MATCHING_MESSAGES + NON_MATCHING_MESSAGES
+    for label, enabled in (("metrics off", False), ("metrics on", True)):
+        metrics = travel_chatbot.enable_metrics() if enabled else None
+        if not enabled:
+            travel_chatbot.disable_metrics()
+        print(f"{label:<12}{_rate(travel_chatbot.respond, messages):>12,.0f} msg/s")
+
+    # the slowest rules by mean time per attempt
+    rules = metrics.snapshot()["rules"]
+    slowest = sorted(rules.items(), key=lambda item: item[1]["seconds"] / max(item[1]["attempts"], 1), reverse=True)
+    for name, rule in slowest[:5]:
+        print(f"  {name:<14}{rule['seconds'] / max(rule['attempts'], 1) * 1e6:>8.2f} us/attempt  ({rule['attempts']:,} attempts)")
+    travel_chatbot.disable_metrics()
+
+
+# =======================================================================
+# SECTION: redos
+# =======================================================================
+# Input families built to make the wildcard-heavy rules backtrack: each
+# repeats the part a rule looks for but never supplies the part it needs
+# to finish, so the engine tries every split point.
+ADVERSARIAL_FAMILIES = {
+    "filler words": "please check the gate ",
+    "flight from, no 'to'": "flight from x ",
+    "date, no flight": "tomorrow ",
+    "airline names": "emirates ",
+    "hotel in in in": "hotel in ",
+    "book book book": "book ",
+    "spaces": " ",
+    "no spaces": "a",
+}
+
+REDOS_LENGTHS = (500, 1000, 2000, 4000, 8000)
+
+# growth exponent above which a rule is flagged (1.0 = linear, 2.0 = quadratic)
+SUPERLINEAR_EXPONENT = 1.3
+
+
+def _time_match(pattern, text, budget=0.2):
+    """
+    Best-of-a-few timing of one pattern.match() call, in seconds.
+    """
+    best = float("inf")
+    spent = 0.0
+    runs = 0
+    while runs < 3 or (spent < budget and runs < 50):
+        start = time.perf_counter()
+        pattern.match(text)
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        runs += 1
+        if elapsed > 1.0:
+            break
+    return best
+
+
+def growth_exponent(lengths, timings):
+    """
+    Slope of log(time) against log(length) between the smallest and the
+    largest input that was measured.
+    """
+    if len(timings) < 2 or timings[0] <= 0:
+        return 0.0
+    return math.log(timings[-1] / timings[0]) / math.log(lengths[len(timings) - 1] / lengths[0])
+
+
+def bench_redos():
+    flagged = []
+    print(f"{'rule':<14}{'worst family':<24}{'exponent':>9}{'time @ max len':>16}")
+    for name, pattern in zip(travel_chatbot.ACTIVE_RULES.names, travel_chatbot.ACTIVE_RULES.patterns):
+        worst = None
+        for family, unit in ADVERSARIAL_FAMILIES.items():
+            timings = []
+            for length in REDOS_LENGTHS:
+                text = (unit * (length // len(unit) + 1))[:length]
+                timings.append(_time_match(pattern, text))
+                # anything this slow has made its point; don't wait on bigger inputs
+                if timings[-1] > 1.0:
+                    break
+            exponent = growth_exponent(REDOS_LENGTHS, timings)
+            if worst is None or exponent > worst[1]:
+                worst = (family, exponent, timings[-1], REDOS_LENGTHS[len(timings) - 1])
+
+        family, exponent, seconds, length = worst
+        mark = "  <-- super-linear" if exponent > SUPERLINEAR_EXPONENT else ""
+        print(f"{name:<14}{family:<24}{exponent:>9.2f}{seconds * 1000:>11.2f} ms @{length}{mark}")
+        if mark:
+            flagged.append(name)
+
+    print(f"\nsuper-linear rules: {', '.join(flagged) or 'none'}")
+
+    # end to end: a pasted 50 KB itinerary with and without the length guard
+    itinerary = ("flight from karachi on tomorrow then hotel in in the evening " * 900)[:50_000]
+    for label, limit in (("no guard", 0), (f"guard {travel_chatbot.MAX_INPUT_CHARS}", travel_chatbot.MAX_INPUT_CHARS)):
+        saved = travel_chatbot.MAX_INPUT_CHARS
+        travel_chatbot.MAX_INPUT_CHARS = limit
+        start = time.perf_counter()
+        travel_chatbot.respond(itinerary)
+        print(f"respond() on 50 KB, {label:<12}{(time.perf_counter() - start) * 1000:>10.1f} ms")
+        travel_chatbot.MAX_INPUT_CHARS = saved
+
+
+# =======================================================================
+# SECTION: reflect
+# =======================================================================
+def reflect_split(text, reflections=travel_chatbot.REFLECTIONS):
+    """
+    The original reflect(): lowercase, split, one dict lookup per word, join.
+    """
+    return " ".join(reflections.get(word, word) for word in text.lower().split())
+
+
+REFLECT_SAMPLES = [
+    "paris", "Lahore", "hotel 2", "new york", "my home",
+    "i want to go where my family and me can relax",
+    "you said i'm going to love your city, me too",
+]
+
+
+def bench_reflect():
+    long_text = " ".join(REFLECT_SAMPLES * 40)
+    reflector = travel_chatbot.DEFAULT_REFLECTOR
+    for label, texts in (("captured groups", REFLECT_SAMPLES), ("long text (~2 KB)", [long_text])):
+        rounds = max(1, 20000 // len(texts))
+        timings = {}
+        for name, func in (("split/join", reflect_split), ("reflect", travel_chatbot.reflect)):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for text in texts:
+                    func(text)
+            timings[name] = rounds * len(texts) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            reflector.many(texts)
+        timings["reflect_many"] = rounds * len(texts) / (time.perf_counter() - start)
+
+        print(f"{label}: " + "  ".join(f"{name} {rate:,.0f}/s" for name, rate in timings.items()))
+
+    # every word new to the Reflector, so each one misses its word cache
+    rng = random.Random(11)
+    texts = [" ".join("".join(rng.choice("abcdefghij") for _ in range(6)) for _ in range(8))
+             for _ in range(20000)]
+    timings = {}
+    for name, func in (("split/join", reflect_split), ("reflect", travel_chatbot.Reflector(travel_chatbot.REFLECTIONS))):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        timings[name] = len(texts) / (time.perf_counter() - start)
+    print("unseen words: " + "  ".join(f"{name} {rate:,.0f}/s" for name, rate in timings.items()))
+
+
+# =======================================================================
+# SECTION: gazetteer
+# =======================================================================
+GAZETTEER_MESSAGES = [
+    "book a flight to New York", "I need a flight for tomorrow",
+    "flight from San Francisco to Rio de Janeiro", "hotel in new york",
+    "british airways please", "find me a hotel near heathrow",
+]
+
+
+def synthetic_gazetteer(count, seed=0):
+    """
+    The bundled entries plus `count` made-up one- to three-word cities.
+    """
+    rng = random.Random(seed)
+    syllables = ["ka", "ra", "chi", "la", "hor", "is", "lam", "san", "to", "ri", "o", "de", "ja", "nei", "ro", "mu", "ba", "dur"]
+    with open(gazetteer.DEFAULT_PATH, encoding="utf-8") as f:
+        entries = gazetteer.read_entries(f.read())
+    for _ in range(count):
+        words = ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+        entries.append(("city", " ".join(words).title(), None))
+    return entries
+
+
+def bench_gazetteer():
+    entries = synthetic_gazetteer(50_000)
+    start = time.perf_counter()
+    trie = gazetteer.Gazetteer.build(entries)
+    build = time.perf_counter() - start
+    arrays = (trie.edge_start, trie.edge_token, trie.edge_target, trie.node_kinds, trie.node_value)
+    size = sum(a.itemsize * len(a) for a in arrays)
+    print(f"{len(entries):,} entries -> {len(trie.node_kinds):,} nodes, {size / 1e6:.2f} MB of arrays, built in {build:.2f}s")
+
+    folder = tempfile.mkdtemp(prefix="gazetteer-bench-")
+    path = os.path.join(folder, "cities.tsv")
+    with open(path, "w", encoding="utf-8") as f:
+        for kind, name, canonical in entries:
+            f.write(f"{kind}\t{name}\n" if canonical is None else f"{kind}\t{name}\t{canonical}\n")
+    try:
+        for label, load_path in (("load, bundled", gazetteer.DEFAULT_PATH), (f"load, {len(entries):,} entries", path)):
+            start = time.perf_counter()
+            gazetteer.load_gazetteer(load_path)
+            print(f"{label:<28}{(time.perf_counter() - start) * 1000:>8.1f} ms")
+    finally:
+        shutil.rmtree(folder)
+
+    rounds = 5000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in GAZETTEER_MESSAGES:
+            trie.scan(message)
+    print(f"scan                  {rounds * len(GAZETTEER_MESSAGES) / (time.perf_counter() - start):>12,.0f} msg/s")
+
+    # what the extra step costs a full reply
+    saved = travel_chatbot.USE_GAZETTEER
+    try:
+        for label, enabled in (("respond, gazetteer off", False), ("respond, gazetteer on", True)):
+            travel_chatbot.USE_GAZETTEER = enabled
+            start = time.perf_counter()
+            for _ in range(2000):
+                for message in GAZETTEER_MESSAGES:
+                    travel_chatbot.respond(message)
+            print(f"{label:<22}{2000 * len(GAZETTEER_MESSAGES) / (time.perf_counter() - start):>12,.0f} msg/s")
+    finally:
+        travel_chatbot.USE_GAZETTEER = saved
+
+
+# =======================================================================
+# SECTION: bookings
+# =======================================================================
+def bench_bookings(threads=32, per_thread=250):
+    booking = bookings.Booking("bench", "hotel", "Hotel 2", 3, 15000, 45000, "PKR", {"city": "Lahore", "tier": "luxury"})
+
+    def book(ledger):
+        futures = [ledger.record(booking) for _ in range(per_thread)]
+        for future in futures:
+            future.result()
+
+    total = threads * per_thread
+    folder = tempfile.mkdtemp(prefix="bookings-bench-")
+    try:
+        for label, batch_size in (("one commit per booking", 1), ("group commit", 512)):
+            ledger = bookings.BookingLedger(os.path.join(folder, f"batch-{batch_size}.db"), batch_size=batch_size)
+            workers = [threading.Thread(target=book, args=(ledger,)) for _ in range(threads)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            stats = ledger.stats()
+            ledger.close()
+            print(f"{label:<24}{total / elapsed:>10,.0f} bookings/s  {stats['commits']:>6,} commits"
+                  f"  {stats['rows_per_commit']:>6.1f} rows/commit")
+    finally:
+        shutil.rmtree(folder)
+
+
+# =======================================================================
+# SECTION: store
+# =======================================================================
+def conversation(count=10_000, turns=10):
+    """
+    `count` sessions halfway through a hotel booking, each with `turns`
+    exchanges of history.
+    """
+    sessions = []
+    for number in range(count):
+        session = travel_chatbot.Session(f"user-{number}")
+        session.update(("city", "hotel_tier"), "hotel_pick", (f"City {number}", "luxury"))
+        history = []
+        for turn in range(turns):
+            history.append(("user", f"message {turn} from user {number}, about a hotel in City {number}"))
+            history.append(("assistant", f"Reply {turn}: searching for hotels in City {number}... luxury or budget?"))
+        sessions.append((session.session_id, session, history))
+    return sessions
+
+
+def bench_store(count=10_000):
+    import tracemalloc
+    sessions = conversation(count)
+
+    # what a process holds per conversation: live objects the way app.py
+    # used to keep them, or one packed blob in the memory store
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    live = [(travel_chatbot.Session(session_id), [{"role": role, "content": text} for role, text in history])
+            for session_id, _, history in sessions]
+    objects = tracemalloc.get_traced_memory()[0] - before
+    del live
+    memory = session_store.MemorySessionStore()
+    before = tracemalloc.get_traced_memory()[0]
+    for session_id, session, history in sessions:
+        memory.save(session_id, session, history)
+    packed = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    blob = memory.stats()["bytes"] / count
+    print(f"per session, 20 messages: objects {objects / count:,.0f} B, packed {packed / count:,.0f} B "
+          f"({blob:,.0f} B blob)")
+
+    folder = tempfile.mkdtemp(prefix="session-bench-")
+    try:
+        stores = (
+            ("memory", memory),
+            ("sqlite, batched", session_store.SQLiteSessionStore(os.path.join(folder, "batched.db"))),
+            ("sqlite, write-through", session_store.SQLiteSessionStore(os.path.join(folder, "each.db"), max_delay=0)),
+        )
+        for label, store in stores:
+            start = time.perf_counter()
+            for session_id, session, history in sessions:
+                store.save(session_id, session, history)
+            store.flush()
+            writes = count / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for session_id, _, _ in sessions:
+                store.load(session_id, travel_chatbot.Session(session_id))
+            reads = count / (time.perf_counter() - start)
+            print(f"{label:<22}{writes:>10,.0f} writes/s{reads:>10,.0f} reads/s")
+            store.close()
+    finally:
+        shutil.rmtree(folder)
+
+
+SECTIONS = {
+    "dispatch": bench_dispatch,
+    "session": bench_session,
+    "render": bench_render,
+    "cache": bench_cache,
+    "metrics": bench_metrics,
+    "redos": bench_redos,
+    "reflect": bench_reflect,
+    "gazetteer": bench_gazetteer,
+    "bookings": bench_bookings,
+    "store": bench_store,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Travel chatbot benchmarks")
+    parser.add_argument("sections", nargs="*", help="sections to run: %s (default: all)" % ", ".join(SECTIONS))
+    args = parser.parse_args()
+
+    unknown = [name for name in args.sections if name not in SECTIONS]
+    if unknown:
+        parser.error("unknown section(s): %s" % ", ".join(unknown))
+
+    for name in args.sections or SECTIONS:
+        print(f"\n=== {name} ===")
+        SECTIONS[name]()
+
+
+if __name__ == "__main__":
+    main()
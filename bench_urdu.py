@@ -0,0 +1,314 @@
+import argparse
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+import urdu_lexicon
+import urdu_segmentation
+
+# =======================================================================
+# Benchmarks for the Urdu sentence segmenter
+# =======================================================================
+# Run everything:     python bench_urdu.py
+# Run one section:    python bench_urdu.py engine --size-mb 100
+# The corpus is synthetic: the sample file repeated up to the asked size.
+# Each section prints its own small report.
+# =======================================================================
+
+SAMPLE_FILE = "urdu-corpus portion.txt"
+
+
+def build_corpus(directory, size_mb, files=1):
+    """
+    Writes `files` files of about size_mb / files megabytes each, made of
+    the sample corpus over and over, and returns the directory.
+    """
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        sample = f.read().encode("utf-8")
+    per_file = int(size_mb * 1e6) // files
+    repeats = max(1, per_file // len(sample))
+    for index in range(files):
+        with open(os.path.join(directory, f"part-{index:03d}.txt"), "wb") as f:
+            for _ in range(repeats):
+                f.write(sample)
+    return directory
+
+
+def worker_counts():
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    if counts[-1] != os.cpu_count():
+        counts.append(os.cpu_count())
+    return counts
+
+
+def report(label, megabytes, sentences, elapsed):
+    print(f"{label:<22} {elapsed:7.2f}s  {megabytes / elapsed:7.2f} MB/s  {sentences / elapsed:12,.0f} sentences/s")
+
+
+# =======================================================================
+# SECTION: parallel
+# =======================================================================
+def bench_parallel(size_mb=20):
+    directory = tempfile.mkdtemp(prefix="urdu-bench-")
+    try:
+        build_corpus(directory, size_mb, files=4)
+        megabytes = urdu_segmentation.corpus_bytes(directory) / 1e6
+        print(f"corpus: {megabytes:.1f} MB in 4 files, {os.cpu_count()} core(s)")
+
+        start = time.perf_counter()
+        expected = 0
+        for file_path in urdu_segmentation.corpus_files(directory):
+            expected += sum(1 for _ in urdu_segmentation.iter_file_sentences(file_path))
+        report("streaming, 1 process", megabytes, expected, time.perf_counter() - start)
+
+        for workers in worker_counts():
+            start = time.perf_counter()
+            count = sum(1 for _ in urdu_segmentation.segment_corpus(directory, workers))
+            report(f"pool, {workers} worker(s)", megabytes, count, time.perf_counter() - start)
+            if count != expected:
+                print(f"  MISMATCH: {count} sentences, streaming gave {expected}")
+    finally:
+        shutil.rmtree(directory)
+
+
+# =======================================================================
+# SECTION: engine
+# =======================================================================
+def segment_sentences_lists(cleaned_text):
+    """
+    The original segment_sentences(): list lookups and a generator over
+    the punctuation marks for every word.
+    """
+    punctuation_marks = urdu_segmentation.punctuation_marks
+    end_words = urdu_segmentation.end_words
+    continuation_words = urdu_segmentation.continuation_words
+
+    words = cleaned_text.split(' ')
+    sentences = []
+    current_sentence = []
+    for i, word in enumerate(words):
+        current_sentence.append(word)
+        ends_with_punctuation = any(word.endswith(punct) for punct in punctuation_marks)
+        next_word = words[i + 1] if i + 1 < len(words) else None
+        suggests_boundary = (word in end_words and (next_word in continuation_words or next_word is None)
+                             and len(current_sentence) >= 2)
+        if ends_with_punctuation or suggests_boundary:
+            full_sentence = ' '.join(current_sentence).strip()
+            if full_sentence:
+                sentences.append(full_sentence)
+            current_sentence = []
+    if current_sentence:
+        full_sentence = ' '.join(current_sentence).strip()
+        if full_sentence:
+            sentences.append(full_sentence)
+    return sentences
+
+
+def bench_engine(size_mb=100):
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        sample = urdu_segmentation.preprocess_urdu_text(f.read())
+    repeats = max(1, int(size_mb * 1e6) // len((sample + " ").encode("utf-8")))
+    text = " ".join([sample] * repeats)
+    words = text.count(" ") + 1
+    print(f"corpus: {len(text.encode('utf-8')) / 1e6:.1f} MB, {words:,} words")
+
+    rules = urdu_segmentation.DEFAULT_RULES
+    candidates = (
+        ("lists (original)", segment_sentences_lists),
+        ("BoundaryRules.segment", rules.segment),
+        ("segment_regex", rules.segment_regex),
+        ("iter_sentences", lambda text: list(urdu_segmentation.iter_sentences(text.split(" ")))),
+    )
+    baseline = None
+    for label, func in candidates:
+        start = time.perf_counter()
+        sentences = func(text)
+        elapsed = time.perf_counter() - start
+
+        checksum = (len(sentences), zlib.crc32("\n".join(sentences).encode("utf-8")))
+        del sentences
+        if baseline is None:
+            baseline = (checksum, elapsed)
+        note = "" if checksum == baseline[0] else "  MISMATCH"
+        print(f"{label:<22} {elapsed:7.2f}s  {words / elapsed:12,.0f} words/s  {baseline[1] / elapsed:5.2f}x{note}")
+
+
+# =======================================================================
+# SECTION: normalize
+# =======================================================================
+# arabic code points put back into the sample, so there is something to fold
+NOISE = str.maketrans({"ی": "ي", "ک": "ك", "ہ": "ه", "۔": "۔\u200c", "ے": "َے"})
+
+CHAINED_STEPS = [
+    (re.compile("[يى]"), "ی"),
+    (re.compile("ك"), "ک"),
+    (re.compile("ه"), "ہ"),
+    (re.compile("[\u064b-\u0652\u0670\u0640]"), ""),
+    (re.compile("[\u200b-\u200f\ufeff]"), ""),
+    (re.compile("\\?"), "؟"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def normalize_chained(text):
+    """
+    The same job done the usual way: one re.sub per kind of fix.
+    """
+    for pattern, replacement in CHAINED_STEPS:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+# the arabic ه is ھ after an aspiratable consonant and ہ anywhere else,
+# also when a chunk or live message edge falls between the two letters
+HEH_CASES = [
+    ("وہ گھر گیا تها اور پھر آیا", ["وہ گھر گیا تھا", "اور پھر آیا"]),
+    ("يه كتاب اس نے پڑهی ہے۔", ["یہ کتاب اس نے پڑھی ہے۔"]),
+]
+
+
+def check_normalize():
+    failures = 0
+    for text, expected in HEH_CASES:
+        results = {
+            "normalize_urdu_text": urdu_segmentation.segment_sentences(urdu_segmentation.normalize_urdu_text(text)),
+            "iter_normalized": urdu_segmentation.segment_sentences(
+                "".join(urdu_segmentation.iter_normalized(io.StringIO(text), chunk_size=3))),
+        }
+        segmenter = urdu_segmentation.UrduSegmenter(normalize=True)
+        sentences = []
+        for start in range(0, len(text), 3):
+            sentences += segmenter.feed(text[start:start + 3])
+        results["UrduSegmenter"] = sentences + segmenter.flush()
+        for label, sentences in results.items():
+            if sentences != expected:
+                failures += 1
+                print(f"MISMATCH {label}: {text!r} -> {sentences!r}, expected {expected!r}")
+    if failures:
+        sys.exit(1)
+    print(f"ه folding: {len(HEH_CASES)} cases ok")
+
+
+def bench_normalize(size_mb=50):
+    check_normalize()
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        sample = f.read().translate(NOISE)
+    text = sample * max(1, int(size_mb * 1e6) // len(sample.encode("utf-8")))
+    megabytes = len(text.encode("utf-8")) / 1e6
+    print(f"corpus: {megabytes:.1f} MB")
+
+    candidates = (
+        ("re.sub chain", normalize_chained),
+        ("preprocess (spaces only)", urdu_segmentation.preprocess_urdu_text),
+        ("normalize_urdu_text", urdu_segmentation.normalize_urdu_text),
+        ("iter_normalized, 1 MB", lambda text: "".join(urdu_segmentation.iter_normalized(io.StringIO(text)))),
+    )
+    expected = urdu_segmentation.normalize_urdu_text(text)
+    for label, func in candidates:
+        start = time.perf_counter()
+        result = func(text)
+        elapsed = time.perf_counter() - start
+        note = "" if label.startswith(("re.sub", "preprocess")) or result == expected else "  MISMATCH"
+        del result
+        print(f"{label:<26} {elapsed:7.2f}s  {megabytes / elapsed:7.1f} MB/s{note}")
+
+
+# =======================================================================
+# SECTION: live
+# =======================================================================
+def bench_live(size_mb=20, message_chars=80):
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        sample = f.read()
+    text = sample * max(1, int(size_mb * 1e6) // len(sample.encode("utf-8")))
+    megabytes = len(text.encode("utf-8")) / 1e6
+    # chat-sized pieces that cut words in half
+    messages = [text[i:i + message_chars] for i in range(0, len(text), message_chars)]
+    print(f"corpus: {megabytes:.1f} MB in {len(messages):,} messages of {message_chars} characters")
+
+    start = time.perf_counter()
+    expected = urdu_segmentation.segment_sentences(urdu_segmentation.preprocess_urdu_text(text))
+    elapsed = time.perf_counter() - start
+    print(f"{'segment_sentences':<22} {elapsed:7.2f}s  {megabytes / elapsed:7.2f} MB/s  (whole text at once)")
+
+    segmenter = urdu_segmentation.UrduSegmenter()
+    sentences = []
+    start = time.perf_counter()
+    for message in messages:
+        sentences.extend(segmenter.feed(message))
+    sentences.extend(segmenter.flush())
+    elapsed = time.perf_counter() - start
+    note = "" if sentences == expected else "  MISMATCH"
+    print(f"{'UrduSegmenter.feed':<22} {elapsed:7.2f}s  {megabytes / elapsed:7.2f} MB/s  "
+          f"{len(messages) / elapsed:12,.0f} messages/s{note}")
+
+
+# =======================================================================
+# SECTION: lexicon
+# =======================================================================
+def bench_lexicon(size_mb=20):
+    directory = tempfile.mkdtemp(prefix="urdu-lexicon-bench-")
+    try:
+        # the sample is already one sentence per line, so it doubles as gold
+        build_corpus(directory, size_mb, files=4)
+        megabytes = urdu_segmentation.corpus_bytes(directory) / 1e6
+        print(f"gold corpus: {megabytes:.1f} MB in 4 files")
+
+        for workers in worker_counts():
+            start = time.perf_counter()
+            totals = urdu_lexicon.count_corpus(directory, workers, shard_size=4 << 20)
+            elapsed = time.perf_counter() - start
+            print(f"{f'count, {workers} worker(s)':<22} {elapsed:7.2f}s  {megabytes / elapsed:7.2f} MB/s")
+
+        path = os.path.join(directory, "urdu.ulex")
+        start = time.perf_counter()
+        urdu_lexicon.Lexicon.from_counts(totals).save(path)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        rules = urdu_lexicon.load_rules(path)
+        loaded = time.perf_counter() - start
+        print(f"table: {rules.lexicon!r}, {os.path.getsize(path) / 1e3:.1f} kB, "
+              f"built in {built * 1000:.1f} ms, loaded in {loaded * 1000:.1f} ms")
+
+        # scored on the training data: this shows speed, not how well it generalizes
+        urdu_lexicon.compare(rules, os.path.join(directory, "part-000.txt"))
+    finally:
+        shutil.rmtree(directory)
+
+
+SECTIONS = {
+    "parallel": bench_parallel,
+    "engine": bench_engine,
+    "normalize": bench_normalize,
+    "live": bench_live,
+    "lexicon": bench_lexicon,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Urdu segmentation benchmarks")
+    parser.add_argument("sections", nargs="*", help="sections to run: %s (default: all)" % ", ".join(SECTIONS))
+    parser.add_argument("--size-mb", type=float,
+                        help="size of the synthetic corpus (default: 20 for parallel, 100 for engine, 50 for normalize, 20 for live and lexicon)")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.sections if name not in SECTIONS]
+    if unknown:
+        parser.error("unknown section(s): %s" % ", ".join(unknown))
+
+    for name in args.sections or SECTIONS:
+        print(f"\n=== {name} ===")
+        if args.size_mb:
+            SECTIONS[name](args.size_mb)
+        else:
+            SECTIONS[name]()
+
+
+if __name__ == "__main__":
+    main()
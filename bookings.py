@@ -0,0 +1,343 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from functools import partial
+
+# =======================================================================
+# BOOKING LEDGER
+# =======================================================================
+# Records the bookings the chatbot confirms. Prices live in PRICES (the
+# reply templates quote the same numbers), rooms come out of an
+# in-memory Inventory, and every confirmed booking is written to a
+# SQLite database in WAL mode.
+#
+# respond() runs on the chat server's event loop, so it can't wait for a
+# disk write. BookingLedger.record() only puts the booking on a queue and
+# returns a Future; one writer thread takes everything that has queued up
+# (up to batch_size, waiting at most max_delay for more) and commits it as
+# one transaction. With synchronous=FULL every commit is one fsync, so a
+# thousand sessions booking at once cost a few fsyncs, not a thousand.
+#
+#   ledger = BookingLedger("bookings.db")
+#   future = ledger.record(booking)   # returns at once
+#   future.result()                   # the row id, once it's on disk
+#
+# A booking made through confirm() that fails to commit gives its rooms
+# back to the inventory and is kept until pop_failed() hands it to
+# whoever answers that session next.
+# =======================================================================
+
+# price per ticket / per room, and its currency
+PRICES = {
+    ("flight", "economy"): (500, "USD"),
+    ("flight", "business"): (1500, "USD"),
+    ("hotel", "luxury"): (15000, "PKR"),
+    ("hotel", "budget"): (8000, "PKR"),
+}
+
+# the replies offer Hotel 1-3 as luxury and Hotel 4-6 as budget
+HOTEL_TIERS = {
+    "Hotel 1": "luxury", "Hotel 2": "luxury", "Hotel 3": "luxury",
+    "Hotel 4": "budget", "Hotel 5": "budget", "Hotel 6": "budget",
+}
+DEFAULT_ROOMS_PER_HOTEL = 50
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+# what the travel_class slot can hold, mapped to a price class
+TRAVEL_CLASSES = {
+    "economy": "economy", "coach": "economy", "standard": "economy",
+    "business": "business", "first class": "business", "first-class": "business",
+}
+
+Booking = namedtuple("Booking", "session_id kind item quantity unit_price total currency details")
+
+
+def parse_count(text):
+    """
+    "3" / "three" -> 3; None for anything else (or zero).
+    """
+    if text is None:
+        return None
+    text = text.strip().lower()
+    count = int(text) if text.isdigit() else NUMBER_WORDS.get(text)
+    return count or None
+
+
+def parse_hotel(text):
+    """
+    "hotel 2" / "Hotel two" / "hotel2" -> "Hotel 2"; None if it isn't one.
+    """
+    if text is None:
+        return None
+    words = text.lower().replace("hotel", "", 1).strip()
+    number = parse_count(words)
+    hotel = f"Hotel {number}"
+    return hotel if hotel in HOTEL_TIERS else None
+
+
+def quote(kind, session, count_text):
+    """
+    Builds the Booking for what the session has asked for, or returns
+    None if a slot the price depends on is missing (missing_slot() says
+    which).
+    """
+    quantity = parse_count(count_text)
+    if quantity is None:
+        return None
+
+    if kind == "hotel":
+        item = parse_hotel(session.hotel)
+        if item is None:
+            return None
+        tier = HOTEL_TIERS[item]
+        details = {"city": session.city, "tier": tier}
+    else:
+        tier = TRAVEL_CLASSES.get((session.travel_class or "").lower())
+        if tier is None:
+            return None
+        item = tier
+        details = {
+            "origin": session.origin, "destination": session.destination, "date": session.date,
+            "airline": session.airline, "trip_type": session.trip_type,
+        }
+
+    unit_price, currency = PRICES[(kind, tier)]
+    details = {key: value for key, value in details.items() if value is not None}
+    return Booking(session.session_id, kind, item, quantity, unit_price, unit_price * quantity, currency, details)
+
+
+def missing_slot(kind, session, count_text):
+    """
+    Why quote() can't price this booking: "count", "hotel" or
+    "travel_class", or None if it can.
+    """
+    if parse_count(count_text) is None:
+        return "count"
+    if kind == "hotel":
+        return "hotel" if parse_hotel(session.hotel) is None else None
+    return "travel_class" if (session.travel_class or "").lower() not in TRAVEL_CLASSES else None
+
+
+class Inventory:
+    """
+    Rooms left per hotel. Thread-safe; reserve() either takes all the
+    rooms asked for or none.
+    """
+
+    def __init__(self, rooms=None):
+        self.rooms = dict(rooms) if rooms is not None else {hotel: DEFAULT_ROOMS_PER_HOTEL for hotel in HOTEL_TIERS}
+        self._lock = threading.Lock()
+
+    def available(self, hotel):
+        with self._lock:
+            return self.rooms.get(hotel, 0)
+
+    def reserve(self, hotel, count):
+        with self._lock:
+            left = self.rooms.get(hotel, 0)
+            if count > left:
+                return False
+            self.rooms[hotel] = left - count
+            return True
+
+    def release(self, hotel, count):
+        with self._lock:
+            self.rooms[hotel] = self.rooms.get(hotel, 0) + count
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT,
+    kind TEXT NOT NULL,
+    item TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    unit_price INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    currency TEXT NOT NULL,
+    details TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_session ON bookings (session_id);
+"""
+
+INSERT = """
+INSERT INTO bookings (session_id, kind, item, quantity, unit_price, total, currency, details, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# tells the writer thread to stop once everything before it is written
+_STOP = object()
+
+
+def connect(path):
+    """
+    Opens the booking database in WAL mode, creating the table if needed.
+    """
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # WAL + FULL: each commit is durable, and costs one fsync of the log
+    connection.execute("PRAGMA synchronous=FULL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class BookingLedger:
+    """
+    Writes bookings to SQLite through a group-commit writer thread and
+    keeps the room inventory.
+    """
+
+    def __init__(self, path, inventory=None, batch_size=512, max_delay=0.002):
+        self.path = path
+        self.inventory = inventory if inventory is not None else Inventory()
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.commits = 0
+        self.written = 0
+        self.last_error = None
+        # session id -> the booking of that session that failed to commit
+        self.failed = {}
+        self._failed_lock = threading.Lock()
+        self._queue = queue.Queue()
+        # opened here so a bad path fails now, not in the thread
+        self._connection = connect(path)
+        self._writer = threading.Thread(target=self._write_loop, name="booking-writer", daemon=True)
+        self._writer.start()
+
+    def confirm(self, kind, session, count_text):
+        """
+        Prices and records a "hotel" or "flight" booking for the session.
+        Returns (booking, None) once it's queued, (None, None) if the
+        session is missing something the price depends on, or
+        (None, rooms_left) if the hotel hasn't got enough rooms.
+        If the write fails later, the rooms are released and the booking
+        is waiting in pop_failed().
+        """
+        booking = quote(kind, session, count_text)
+        if booking is None:
+            return None, None
+        if kind == "hotel" and not self.inventory.reserve(booking.item, booking.quantity):
+            return None, self.inventory.available(booking.item)
+        self.record(booking).add_done_callback(partial(self._settle, booking))
+        return booking, None
+
+    def _settle(self, booking, future):
+        # runs on the writer thread once the booking's batch is committed
+        # or has failed
+        if future.exception() is None:
+            return
+        if booking.kind == "hotel":
+            self.inventory.release(booking.item, booking.quantity)
+        with self._failed_lock:
+            self.failed[booking.session_id] = booking
+
+    def pop_failed(self, session_id):
+        """
+        Returns the booking of this session that failed to commit (and
+        forgets it), or None.
+        """
+        if not self.failed:
+            return None
+        with self._failed_lock:
+            return self.failed.pop(session_id, None)
+
+    def record(self, booking):
+        """
+        Queues a booking for the writer thread. The returned Future
+        resolves to the row id once the batch holding it is committed.
+        """
+        future = Future()
+        self._queue.put((booking, time.time(), future))
+        return future
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            try:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write_loop(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            # flush() markers carry no booking, they only wait for the commit
+            bookings = [(b, created_at, future) for b, created_at, future in batch if b is not None]
+            try:
+                if bookings:
+                    with self._connection:
+                        row_ids = [
+                            self._connection.execute(INSERT, (
+                                b.session_id, b.kind, b.item, b.quantity, b.unit_price, b.total,
+                                b.currency, json.dumps(b.details, ensure_ascii=False), created_at,
+                            )).lastrowid
+                            for b, created_at, _ in bookings
+                        ]
+                    self.commits += 1
+                    self.written += len(bookings)
+                    for (_, _, future), row_id in zip(bookings, row_ids):
+                        future.set_result(row_id)
+            except sqlite3.Error as error:
+                self.last_error = error
+                for _, _, future in bookings:
+                    future.set_exception(error)
+            for b, _, future in batch:
+                if b is None:
+                    future.set_result(None)
+        self._connection.close()
+
+    def flush(self, timeout=None):
+        """
+        Waits until everything queued so far is committed.
+        """
+        marker = Future()
+        self._queue.put((None, None, marker))
+        marker.result(timeout)
+
+    def close(self):
+        """
+        Writes whatever is still queued and stops the writer thread.
+        """
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "commits": self.commits,
+            "rows_per_commit": self.written / self.commits if self.commits else 0.0,
+            "queued": self._queue.qsize(),
+            "failed": len(self.failed),
+        }
+
+    def bookings_for(self, session_id):
+        """
+        The stored bookings of one session, oldest first.
+        """
+        connection = connect(self.path)
+        try:
+            rows = connection.execute(
+                "SELECT session_id, kind, item, quantity, unit_price, total, currency, details "
+                "FROM bookings WHERE session_id = ? ORDER BY id", (session_id,)).fetchall()
+        finally:
+            connection.close()
+        return [Booking(*row[:7], json.loads(row[7])) for row in rows]
@@ -0,0 +1,488 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import signal
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import travel_chatbot
+from travel_chatbot import respond, Session
+
+# =======================================================================
+# ASYNC HTTP / WEBSOCKET SERVER FOR THE TRAVEL CHATBOT
+# =======================================================================
+# A small asyncio server (standard library only) so many users can chat
+# with the bot at once, instead of one blocking input() loop per process.
+#
+#   POST /chat   {"session": "<id, optional>", "message": "hi"}
+#                -> {"session": "<id>", "reply": "...", "stage": "start"}
+#   GET  /ws     WebSocket; every text frame is one message, every reply
+#                comes back as one text frame. ?session=<id> resumes.
+#   GET  /health -> ok
+#   GET  /metrics, /metrics.json -> per-rule metrics (with --metrics)
+#
+# Session state lives in memory in an LRU cache with a size cap and an
+# idle TTL. Backpressure comes from a cap on open connections, a cap on
+# messages being answered at once and a cap on messages waiting for one
+# of those slots; past those the server answers 503 instead of queueing
+# without bound.
+#
+# respond() runs on a pool of max_inflight threads, not on the event loop,
+# so one slow reply (a long message, a booking, a rule reload) doesn't
+# hold up every other connection. The threads share the GIL, so the pool
+# doesn't make replies any faster; it keeps the loop free to read, write
+# and turn requests away. Messages of the same session are answered one at
+# a time, in the order they arrived.
+#
+# Run it with:  python chat_server.py --port 8080
+# =======================================================================
+
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# status line text for the few codes we actually send
+STATUS_TEXT = {
+    101: "Switching Protocols",
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    503: "Service Unavailable",
+}
+
+
+class SessionCache:
+    """
+    Keeps one Session per session id, evicting the least recently used
+    one past `maxsize` and any session idle for longer than `ttl` seconds.
+    """
+
+    def __init__(self, maxsize=100_000, ttl=30 * 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        """
+        Returns the session for this id, creating it if it's new or expired.
+        """
+        now = time.monotonic()
+        entry = self._sessions.get(session_id)
+        if entry is not None and now - entry[1] <= self.ttl:
+            self._sessions.move_to_end(session_id)
+            entry[1] = now
+            return entry[0]
+
+        session = Session(session_id)
+        self._sessions[session_id] = [session, now]
+        self._sessions.move_to_end(session_id)
+        self._evict(now)
+        return session
+
+    def _evict(self, now):
+        # oldest entries sit at the front, so stop at the first fresh one
+        while self._sessions:
+            session_id, (session, last_seen) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.maxsize and now - last_seen <= self.ttl:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+
+class ChatServer:
+    """
+    Serves `respond()` over HTTP and WebSocket on one asyncio event loop.
+    """
+
+    def __init__(self, max_sessions=100_000, session_ttl=30 * 60, max_connections=10_000,
+                 max_inflight=32, max_queue=1024, queue_timeout=1.0, max_body=64 * 1024, idle_timeout=60.0):
+        self.sessions = SessionCache(max_sessions, session_ttl)
+        self.max_connections = max_connections
+        self.max_body = max_body
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self.rejected = 0
+        self.waiting = 0
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._executor = ThreadPoolExecutor(max_inflight, thread_name_prefix="respond")
+        # session id -> lock held while one of its messages is answered
+        self._session_locks = weakref.WeakValueDictionary()
+
+    # -------------------------------------------------------------------
+    # answering one message
+    # -------------------------------------------------------------------
+    async def answer(self, session_id, message):
+        """
+        Waits (at most queue_timeout) for a free slot and answers the
+        message. Returns None if the server is too busy: max_queue
+        messages are already waiting, or no slot freed up in time.
+        """
+        # checked before the first await, so a burst can't overrun it
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            return None
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._inflight.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return None
+        finally:
+            self.waiting -= 1
+        try:
+            lock = self._session_locks.get(session_id)
+            if lock is None:
+                lock = self._session_locks[session_id] = asyncio.Lock()
+            async with lock:
+                session = self.sessions.get(session_id)
+                reply = await asyncio.get_running_loop().run_in_executor(self._executor, respond, message, session)
+                return reply, session.stage
+        finally:
+            self._inflight.release()
+
+    def close(self):
+        """
+        Stops the respond() threads once the replies in progress are done.
+        """
+        self._executor.shutdown(wait=False)
+
+    # -------------------------------------------------------------------
+    # connection handling
+    # -------------------------------------------------------------------
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.connections > self.max_connections:
+                self.rejected += 1
+                await self._send_json(writer, 503, {"error": "too many connections"}, keep_alive=False)
+                return
+
+            # HTTP/1.1 keep-alive: serve requests until the client is done
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.idle_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._send_json(writer, 431, {"error": "headers too large"}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+
+                method, target, headers = request
+                url = urlsplit(target)
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                if url.path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, headers, parse_qs(url.query))
+                    return
+                if not await self._http(reader, writer, method, url.path, headers, keep_alive):
+                    return
+                if not keep_alive:
+                    return
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        return method, target, headers
+
+    async def _http(self, reader, writer, method, path, headers, keep_alive):
+        """
+        Handles one plain HTTP request. Returns False if the connection
+        should be closed afterwards.
+        """
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            await self._send_json(writer, 400, {"error": "bad content-length"}, keep_alive=False)
+            return False
+        if length > self.max_body:
+            await self._send_json(writer, 413, {"error": "message too large"}, keep_alive=False)
+            return False
+        body = await reader.readexactly(length) if length else b""
+
+        if path == "/health":
+            await self._send(writer, 200, b"ok", "text/plain", keep_alive)
+            return True
+        if path in ("/metrics", "/metrics.json") and travel_chatbot.METRICS is not None:
+            if path == "/metrics":
+                body, content_type = travel_chatbot.METRICS.to_prometheus(), "text/plain; version=0.0.4"
+            else:
+                body, content_type = travel_chatbot.METRICS.to_json(), "application/json"
+            await self._send(writer, 200, body.encode("utf-8"), content_type, keep_alive)
+            return True
+        if path != "/chat":
+            await self._send_json(writer, 404, {"error": "not found"}, keep_alive)
+            return True
+        if method != "POST":
+            await self._send_json(writer, 405, {"error": "use POST"}, keep_alive)
+            return True
+
+        try:
+            payload = json.loads(body)
+            message = payload["message"]
+            if not isinstance(message, str):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            await self._send_json(writer, 400, {"error": "expected {\"message\": \"...\"}"}, keep_alive)
+            return True
+
+        session_id = str(payload.get("session") or uuid.uuid4().hex)
+        result = await self.answer(session_id, message)
+        if result is None:
+            await self._send_json(writer, 503, {"error": "busy, try again"}, keep_alive, retry_after=1)
+            return True
+
+        reply, stage = result
+        await self._send_json(writer, 200, {"session": session_id, "reply": reply, "stage": stage}, keep_alive)
+        return True
+
+    async def _send(self, writer, status, body, content_type, keep_alive, retry_after=None):
+        head = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            "Connection: " + ("keep-alive" if keep_alive else "close"),
+        ]
+        if retry_after is not None:
+            head.append(f"Retry-After: {retry_after}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        # waiting for the buffer to drain is what pushes back on slow readers
+        await writer.drain()
+
+    async def _send_json(self, writer, status, payload, keep_alive, retry_after=None):
+        body = json.dumps(payload).encode("utf-8")
+        await self._send(writer, status, body, "application/json", keep_alive, retry_after)
+
+    # -------------------------------------------------------------------
+    # WebSocket (RFC 6455, text frames only)
+    # -------------------------------------------------------------------
+    async def _websocket(self, reader, writer, headers, query):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            await self._send_json(writer, 400, {"error": "missing Sec-WebSocket-Key"}, keep_alive=False)
+            return
+
+        accept = base64.b64encode(hashlib.sha1(key.encode("latin-1") + WEBSOCKET_GUID).digest()).decode("ascii")
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("latin-1"))
+        await writer.drain()
+
+        session_id = query.get("session", [uuid.uuid4().hex])[0]
+        while True:
+            try:
+                message = await asyncio.wait_for(self._read_message(reader, writer), self.idle_timeout)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                return
+            if message is None:
+                return
+
+            result = await self.answer(session_id, message)
+            if result is None:
+                reply = json.dumps({"error": "busy, try again"})
+            else:
+                reply = json.dumps({"session": session_id, "reply": result[0], "stage": result[1]})
+            # the next frame isn't read until this one has drained
+            await self._write_frame(writer, 0x1, reply.encode("utf-8"))
+
+    async def _read_message(self, reader, writer):
+        """
+        Reads frames until one complete text message arrives.
+        Answers pings on the way. Returns None when the connection should close.
+        """
+        fragments = []
+        size = 0
+        while True:
+            first, second = await reader.readexactly(2)
+            fin = first & 0x80
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = int.from_bytes(await reader.readexactly(2), "big")
+            elif length == 127:
+                length = int.from_bytes(await reader.readexactly(8), "big")
+
+            size += length
+            if size > self.max_body:
+                await self._write_frame(writer, 0x8, (1009).to_bytes(2, "big"))
+                return None
+
+            mask = await reader.readexactly(4) if second & 0x80 else None
+            payload = await reader.readexactly(length)
+            if mask is not None:
+                payload = _unmask(payload, mask)
+
+            if opcode == 0x8:
+                await self._write_frame(writer, 0x8, payload[:2])
+                return None
+            if opcode == 0x9:
+                await self._write_frame(writer, 0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+            if opcode == 0x2:
+                # binary messages aren't part of the protocol
+                await self._write_frame(writer, 0x8, (1003).to_bytes(2, "big"))
+                return None
+
+            fragments.append(payload)
+            if fin:
+                try:
+                    return b"".join(fragments).decode("utf-8")
+                except UnicodeDecodeError:
+                    await self._write_frame(writer, 0x8, (1007).to_bytes(2, "big"))
+                    return None
+
+    async def _write_frame(self, writer, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            head = bytes((0x80 | opcode, length))
+        elif length < 1 << 16:
+            head = bytes((0x80 | opcode, 126)) + length.to_bytes(2, "big")
+        else:
+            head = bytes((0x80 | opcode, 127)) + length.to_bytes(8, "big")
+        writer.write(head + payload)
+        await writer.drain()
+
+
+def _unmask(payload, mask):
+    """
+    XORs the payload with the 4-byte client mask, as one big integer
+    operation rather than byte by byte.
+    """
+    if not payload:
+        return payload
+    repeated = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    value = int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")
+    return value.to_bytes(len(payload), "big")
+
+
+# the poller and SIGHUP can both ask for a reload, each on a worker thread
+_RELOAD_LOCK = threading.Lock()
+
+
+def check_rules(watcher):
+    """
+    Reloads the rule file if it changed; a broken file keeps the old rules.
+    Compiling the rules takes a while, so the server calls this off the
+    event loop.
+    """
+    with _RELOAD_LOCK:
+        _check_rules(watcher)
+
+
+def _check_rules(watcher):
+    try:
+        if watcher.check():
+            print(f"Reloaded {travel_chatbot.ACTIVE_RULES!r}")
+    except travel_chatbot.RuleFileError as error:
+        print(f"Rule file not reloaded, keeping the current rules: {error}")
+
+
+async def watch_rules(watcher, interval):
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.get_running_loop().run_in_executor(None, check_rules, watcher)
+
+
+async def serve(host, port, rules_path=None, reload_interval=2.0, **options):
+    server = ChatServer(**options)
+    loop = asyncio.get_running_loop()
+
+    # hot reload: poll the rule file, and also reload right away on SIGHUP
+    if rules_path:
+        watcher = travel_chatbot.RuleFileWatcher(rules_path)
+        check_rules(watcher)
+        if reload_interval > 0:
+            loop.create_task(watch_rules(watcher, reload_interval))
+        try:
+            loop.add_signal_handler(signal.SIGHUP, loop.run_in_executor, None, check_rules, watcher)
+        except (NotImplementedError, AttributeError):
+            # no SIGHUP on this platform
+            pass
+
+    listener = await asyncio.start_server(server.handle_connection, host, port, backlog=4096)
+    print(f"Travel chatbot listening on http://{host}:{port}  (POST /chat, GET /ws)")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async HTTP/WebSocket server for the travel chatbot")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-sessions", type=int, default=100_000, help="LRU cap on sessions kept in memory")
+    parser.add_argument("--session-ttl", type=float, default=30 * 60, help="seconds before an idle session is dropped")
+    parser.add_argument("--max-connections", type=int, default=10_000, help="open connections before answering 503")
+    parser.add_argument("--max-inflight", type=int, default=32, help="messages answered at once (respond() threads)")
+    parser.add_argument("--max-queue", type=int, default=1024, help="messages waiting for a slot before answering 503")
+    parser.add_argument("--queue-timeout", type=float, default=1.0, help="seconds a message may wait for a slot")
+    parser.add_argument("--cache-size", type=int, default=0, help="entries in the response cache (0 = off)")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="seconds a cached entry stays valid")
+    parser.add_argument("--metrics", action="store_true", help="record per-rule metrics and serve them on /metrics")
+    parser.add_argument("--bookings", metavar="FILE", help="record confirmed bookings in this SQLite database")
+    parser.add_argument("--rules", metavar="FILE", help="JSON/YAML rule file, reloaded when it changes")
+    parser.add_argument("--reload-interval", type=float, default=2.0, help="seconds between rule file checks (0 = SIGHUP only)")
+    args = parser.parse_args()
+
+    if args.metrics:
+        travel_chatbot.enable_metrics()
+    if args.cache_size:
+        travel_chatbot.enable_response_cache(args.cache_size, args.cache_ttl)
+    if args.bookings:
+        travel_chatbot.enable_bookings(args.bookings)
+
+    try:
+        asyncio.run(serve(
+            args.host, args.port,
+            rules_path=args.rules,
+            reload_interval=args.reload_interval,
+            max_sessions=args.max_sessions,
+            session_ttl=args.session_ttl,
+            max_connections=args.max_connections,
+            max_inflight=args.max_inflight,
+            max_queue=args.max_queue,
+            queue_timeout=args.queue_timeout,
+        ))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # write out bookings still waiting in the queue
+        travel_chatbot.disable_bookings()
+
+
+if __name__ == "__main__":
+    main()
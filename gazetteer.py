@@ -0,0 +1,264 @@
+import os
+import re
+import hashlib
+import threading
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+# =======================================================================
+# ENTITY GAZETTEER
+# =======================================================================
+# Recognises cities, airports, airlines and dates by looking the input up
+# word by word in a token trie built from gazetteer.tsv, instead of
+# guessing from regex wildcards. One left-to-right scan returns the
+# longest entity starting at each word, so "new york" comes back as one
+# city and "tomorrow" as a date rather than a destination.
+#
+# The trie is flattened into a handful of arrays (about 20 bytes per
+# node, no per-node Python objects):
+#   edge_start[n] .. edge_start[n + 1]   the edges leaving node n
+#   edge_token[e], edge_target[e]        sorted by token id, so a child
+#                                        is found with one bisect
+#   node_kinds[n]                        bitmask of KINDS ending at n
+#   node_value[n]                        canonical name index, or -1
+# Nothing is loaded until the first lookup. The bundled TSV is a few
+# hundred names and compiles in a few milliseconds; a 50,000-name file
+# takes about half a second (python bench_chatbot.py gazetteer).
+# =======================================================================
+
+KINDS = ("city", "airport", "airline", "date")
+KIND_BITS = {kind: 1 << position for position, kind in enumerate(KINDS)}
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.tsv")
+
+# a word: letters/digits, with inner apostrophes ("xi'an", "o'hare")
+TOKEN = re.compile(r"\w+(?:['’]\w+)*")
+
+# one recognised entity: character offsets into the scanned text, the
+# kind that was asked for, and the canonical name
+Entity = namedtuple("Entity", "start end kind value")
+
+
+class GazetteerError(ValueError):
+    """
+    Raised when a gazetteer file can't be read or has a bad line.
+    """
+
+
+def tokenize(text):
+    """
+    The lower-cased words of `text` with their (start, end) offsets.
+    """
+    return [(match.start(), match.end(), match.group().lower().replace("’", "'"))
+            for match in TOKEN.finditer(text)]
+
+
+class Gazetteer:
+    """
+    A compiled, array-backed token trie. Build one with
+    Gazetteer.build() or load_gazetteer().
+    """
+
+    def __init__(self, vocab, edge_start, edge_token, edge_target, node_kinds, node_value, values):
+        # token -> id; ids are positions in the sorted vocabulary
+        self.vocab = vocab
+        self.edge_start = edge_start
+        self.edge_token = edge_token
+        self.edge_target = edge_target
+        self.node_kinds = node_kinds
+        self.node_value = node_value
+        self.values = values
+        self.digest = None
+
+    def __len__(self):
+        return sum(1 for kinds in self.node_kinds if kinds)
+
+    @classmethod
+    def build(cls, entries):
+        """
+        Compiles (kind, name, canonical) entries. A name listed under
+        several kinds keeps every kind, and the canonical name of its
+        first entry.
+        """
+        children = [{}]
+        kinds = [0]
+        value_of = [-1]
+        values = []
+        value_ids = {}
+        for kind, name, canonical in entries:
+            node = 0
+            for _, _, token in tokenize(name):
+                child = children[node].get(token)
+                if child is None:
+                    child = len(children)
+                    children[node][token] = child
+                    children.append({})
+                    kinds.append(0)
+                    value_of.append(-1)
+                node = child
+            if node == 0:
+                continue
+            kinds[node] |= KIND_BITS[kind]
+            if value_of[node] < 0:
+                canonical = canonical or name
+                if canonical not in value_ids:
+                    value_ids[canonical] = len(values)
+                    values.append(canonical)
+                value_of[node] = value_ids[canonical]
+
+        vocab = {token: position for position, token in
+                 enumerate(sorted({token for edges in children for token in edges}))}
+        edge_start = array("I", [0])
+        edge_token = array("I")
+        edge_target = array("I")
+        for edges in children:
+            for token_id, target in sorted((vocab[token], target) for token, target in edges.items()):
+                edge_token.append(token_id)
+                edge_target.append(target)
+            edge_start.append(len(edge_token))
+
+        return cls(vocab, edge_start, edge_token, edge_target,
+                   array("B", kinds), array("i", value_of), values)
+
+    def _child(self, node, token_id):
+        low, high = self.edge_start[node], self.edge_start[node + 1]
+        position = bisect_left(self.edge_token, token_id, low, high)
+        if position < high and self.edge_token[position] == token_id:
+            return self.edge_target[position]
+        return -1
+
+    def scan(self, text, kinds=KINDS):
+        """
+        Returns the entities of the given kinds in `text`, left to right,
+        longest match first and never overlapping.
+        """
+        wanted = 0
+        for kind in kinds:
+            wanted |= KIND_BITS[kind]
+        vocab = self.vocab
+        tokens = tokenize(text)
+        ids = [vocab.get(token, -1) for _, _, token in tokens]
+
+        entities = []
+        i = 0
+        while i < len(tokens):
+            node = 0
+            best = None
+            j = i
+            while j < len(tokens) and ids[j] >= 0:
+                node = self._child(node, ids[j])
+                if node < 0:
+                    break
+                j += 1
+                if self.node_kinds[node] & wanted:
+                    best = (j, node)
+            if best is None:
+                i += 1
+                continue
+            end, node = best
+            matched = self.node_kinds[node] & wanted
+            kind = next(kind for kind in kinds if matched & KIND_BITS[kind])
+            entities.append(Entity(tokens[i][0], tokens[end - 1][1], kind, self.values[self.node_value[node]]))
+            i = end
+        return entities
+
+    def match_at(self, text, start, kinds=KINDS):
+        """
+        The longest entity of one of `kinds` whose first word starts at
+        character `start` of `text`, or None. Only reads as many words as
+        the trie can follow, so it's cheaper than scan() for checking
+        one captured group.
+        """
+        wanted = 0
+        for kind in kinds:
+            wanted |= KIND_BITS[kind]
+        vocab = self.vocab
+        node = 0
+        best = None
+        for match in TOKEN.finditer(text, start):
+            if node == 0 and match.start() != start:
+                return None
+            token_id = vocab.get(match.group().lower().replace("’", "'"))
+            if token_id is None:
+                break
+            node = self._child(node, token_id)
+            if node < 0:
+                break
+            if self.node_kinds[node] & wanted:
+                best = (match.end(), node)
+        if best is None:
+            return None
+        end, node = best
+        matched = self.node_kinds[node] & wanted
+        kind = next(kind for kind in kinds if matched & KIND_BITS[kind])
+        return Entity(start, end, kind, self.values[self.node_value[node]])
+
+    def lookup(self, name):
+        """
+        (kinds, canonical name) for an exact name, or None.
+        """
+        node = 0
+        for _, _, token in tokenize(name):
+            token_id = self.vocab.get(token)
+            node = -1 if token_id is None else self._child(node, token_id)
+            if node < 0:
+                return None
+        if node == 0 or not self.node_kinds[node]:
+            return None
+        return ([kind for kind in KINDS if self.node_kinds[node] & KIND_BITS[kind]],
+                self.values[self.node_value[node]])
+
+    def __repr__(self):
+        return f"Gazetteer({len(self)} entries, {len(self.node_kinds)} nodes)"
+
+
+def read_entries(raw, path="<gazetteer>"):
+    """
+    Parses the TSV text: kind<TAB>name[<TAB>canonical], '#' comments.
+    """
+    entries = []
+    for number, line in enumerate(raw.splitlines(), 1):
+        if not line.strip() or line.startswith("#"):
+            continue
+        fields = line.rstrip("\r\n").split("\t")
+        if len(fields) not in (2, 3) or fields[0] not in KIND_BITS or not fields[1].strip():
+            raise GazetteerError(f"{path}:{number}: expected kind<TAB>name[<TAB>canonical] with kind in {KINDS}")
+        entries.append((fields[0], fields[1].strip(), fields[2].strip() if len(fields) == 3 else None))
+    return entries
+
+
+def load_gazetteer(path=DEFAULT_PATH):
+    """
+    Reads and compiles a gazetteer TSV.
+    """
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError as error:
+        raise GazetteerError(f"can't read {path}: {error}")
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError as error:
+        raise GazetteerError(f"{path}: {error}")
+    gazetteer = Gazetteer.build(read_entries(text, path))
+    gazetteer.digest = hashlib.sha256(raw).hexdigest()
+    return gazetteer
+
+
+_DEFAULT = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_gazetteer():
+    """
+    The shared gazetteer (the TSV named by TRAVEL_GAZETTEER, else the
+    bundled one), loaded on first use.
+    """
+    global _DEFAULT
+    if _DEFAULT is None:
+        with _DEFAULT_LOCK:
+            if _DEFAULT is None:
+                path = os.environ.get("TRAVEL_GAZETTEER", "")
+                _DEFAULT = load_gazetteer(DEFAULT_PATH if path.lower() in ("", "on") else path)
+    return _DEFAULT
@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import sys
+import time
+
+# =======================================================================
+# LOAD GENERATOR FOR chat_server.py
+# =======================================================================
+# Simulates many users chatting at once. Every user opens its own
+# keep-alive connection (or WebSocket) and walks through the booking
+# funnel, then the script prints requests/s and p50/p99 latency.
+#
+#   python chat_server.py --port 8080 &
+#   python load_test.py --users 1000 --rounds 5
+#   python load_test.py --users 1000 --rounds 5 --mode ws
+#
+# --check-backpressure starts its own server with one message slot and a
+# short queue instead, and exits non-zero unless some requests were turned
+# away with 503:
+#
+#   python load_test.py --check-backpressure --users 200
+# =======================================================================
+
+CONVERSATION = [
+    "hi", "I want to book a hotel", "Lahore", "luxury", "hotel 2", "3",
+    "book a flight", "Paris", "round trip", "economy", "2",
+]
+
+
+def raise_file_limit(needed):
+    """
+    Every simulated user holds a socket, so lift the soft fd limit if we can.
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+async def http_user(host, port, user_id, rounds, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(rounds):
+            for message in CONVERSATION:
+                body = json.dumps({"session": f"user-{user_id}", "message": message}).encode("utf-8")
+                request = (
+                    f"POST /chat HTTP/1.1\r\nHost: {host}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+                ).encode("latin-1") + body
+
+                start = time.perf_counter()
+                writer.write(request)
+                await writer.drain()
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                await reader.readexactly(length)
+                latencies.append(time.perf_counter() - start)
+
+                if not head.startswith(b"HTTP/1.1 200"):
+                    errors.append(head.split(b"\r\n", 1)[0].decode("latin-1"))
+    finally:
+        writer.close()
+
+
+async def ws_user(host, port, user_id, rounds, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        writer.write((
+            f"GET /ws?session=user-{user_id} HTTP/1.1\r\nHost: {host}\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode("latin-1"))
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        if not head.startswith(b"HTTP/1.1 101"):
+            errors.append(head.split(b"\r\n", 1)[0].decode("latin-1"))
+            return
+
+        mask = os.urandom(4)
+        for _ in range(rounds):
+            for message in CONVERSATION:
+                payload = message.encode("utf-8")
+                masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+                start = time.perf_counter()
+                writer.write(bytes((0x81, 0x80 | len(payload))) + mask + masked)
+                await writer.drain()
+                _, length = await reader.readexactly(2)
+                if length == 126:
+                    length = int.from_bytes(await reader.readexactly(2), "big")
+                reply = await reader.readexactly(length)
+                latencies.append(time.perf_counter() - start)
+
+                if b'"error"' in reply:
+                    errors.append(reply.decode("utf-8"))
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run(host, port, users, rounds, mode):
+    latencies = []
+    errors = []
+    user = ws_user if mode == "ws" else http_user
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(user(host, port, i, rounds, latencies, errors) for i in range(users)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    failures = [r for r in results if isinstance(r, Exception)]
+    latencies.sort()
+    print(f"mode={mode} users={users} rounds={rounds}")
+    print(f"requests      : {len(latencies):,} in {elapsed:.2f}s")
+    print(f"throughput    : {len(latencies) / elapsed:,.0f} req/s")
+    print(f"latency p50   : {percentile(latencies, 0.50) * 1000:.2f} ms")
+    print(f"latency p99   : {percentile(latencies, 0.99) * 1000:.2f} ms")
+    print(f"errors        : {len(errors)} responses, {len(failures)} failed users")
+    if failures:
+        print(f"first failure : {failures[0]!r}")
+
+
+async def check_backpressure(users, rounds, max_inflight=1, max_queue=4):
+    """
+    Runs the HTTP users against an in-process ChatServer with tiny caps.
+    Returns the number of 503 answers and of other failures.
+    """
+    import chat_server
+
+    server = chat_server.ChatServer(max_inflight=max_inflight, max_queue=max_queue, queue_timeout=0.05)
+    listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0, backlog=4096)
+    port = listener.sockets[0].getsockname()[1]
+    latencies = []
+    errors = []
+    async with listener:
+        results = await asyncio.gather(
+            *(http_user("127.0.0.1", port, i, rounds, latencies, errors) for i in range(users)),
+            return_exceptions=True,
+        )
+    server.close()
+    busy = sum(1 for error in errors if " 503 " in error)
+    failures = [r for r in results if isinstance(r, Exception)]
+    print(f"max_inflight={max_inflight} max_queue={max_queue} users={users} rounds={rounds}")
+    print(f"requests      : {len(latencies):,}")
+    print(f"rejected (503): {busy:,} (server counted {server.rejected:,})")
+    print(f"other errors  : {len(errors) - busy} responses, {len(failures)} failed users")
+    return busy, len(errors) - busy + len(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for chat_server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--users", type=int, default=1000, help="concurrent simulated users")
+    parser.add_argument("--rounds", type=int, default=3, help="times each user walks the booking funnel")
+    parser.add_argument("--mode", choices=("http", "ws"), default="http")
+    parser.add_argument("--check-backpressure", action="store_true",
+                        help="run against an in-process server with tiny caps and fail if nothing is rejected")
+    args = parser.parse_args()
+
+    raise_file_limit(args.users * 2 + 64)
+    if args.check_backpressure:
+        busy, other = asyncio.run(check_backpressure(args.users, args.rounds))
+        if not busy or other:
+            print("FAIL: expected 503s and no other errors", file=sys.stderr)
+            sys.exit(1)
+        return
+    asyncio.run(run(args.host, args.port, args.users, args.rounds, args.mode))
+
+
+if __name__ == "__main__":
+    main()
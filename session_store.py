@@ -0,0 +1,333 @@
+import logging
+import marshal
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# =======================================================================
+# SESSION STORE
+# =======================================================================
+# Keeps each conversation's dialogue state and recent history outside the
+# process that is answering it, so any worker can pick a conversation up.
+# The Streamlit app and the command line chat both go through two calls:
+#
+#   history = store.load(session_id, session)   # fills `session` in place
+#   ...
+#   store.save(session_id, session, history)
+#
+# A conversation is stored as one small blob: the funnel stage, the slot
+# values in Session.SLOT_NAMES order and the last `history_limit` messages,
+# as plain tuples packed with marshal. That's as small and as fast as
+# pickle (and about 5x faster than JSON), but loading a blob that another
+# process wrote can only ever build tuples and strings. Nothing in the blob
+# refers to a class, so the store doesn't need to import travel_chatbot;
+# any object with `stage` and the SLOT_NAMES attributes can be loaded into.
+#
+# Backends:
+#   MemorySessionStore  - a dict of blobs in this process (LRU-capped)
+#   SQLiteSessionStore  - one table in a WAL-mode database that several
+#                         processes share; writes are batched
+#   SpillFile           - a scratch file one process parks sessions in when
+#                         it can't keep them all in memory (replay())
+# =======================================================================
+
+log = logging.getLogger(__name__)
+
+# bump when the blob layout changes; blobs of another format read as missing
+FORMAT = 1
+
+# messages kept per conversation (user and bot both count)
+HISTORY_LIMIT = 40
+
+ROLES = ("user", "assistant")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+
+def pack(session, history, history_limit=HISTORY_LIMIT):
+    """
+    Packs the session's stage and slots and the last `history_limit`
+    (role, text) messages of `history` into bytes.
+    """
+    history = list(history)[-history_limit:] if history_limit else []
+    flat = []
+    for role, text in history:
+        flat.append(ROLE_CODES[role])
+        flat.append(text)
+    slots = tuple(getattr(session, slot) for slot in session.SLOT_NAMES)
+    return marshal.dumps((FORMAT, session.stage, slots, tuple(flat)))
+
+
+def unpack(data, session):
+    """
+    Fills `session` from a blob made by pack() and returns its history as
+    a list of (role, text), or returns None (leaving `session` alone) if
+    the blob is of another format or damaged.
+    """
+    try:
+        version, stage, slots, flat = marshal.loads(data)
+        if version != FORMAT or len(slots) != len(session.SLOT_NAMES):
+            return None
+        history = [(ROLES[flat[i]], flat[i + 1]) for i in range(0, len(flat), 2)]
+    except (EOFError, ValueError, TypeError, IndexError):
+        return None
+    session.stage = stage
+    for slot, value in zip(session.SLOT_NAMES, slots):
+        setattr(session, slot, value)
+    return history
+
+
+class MemorySessionStore:
+    """
+    Session blobs in a dict, for a single process. Past `maxsize`
+    conversations the least recently used one is dropped.
+    """
+
+    def __init__(self, maxsize=100_000, history_limit=HISTORY_LIMIT):
+        self.maxsize = maxsize
+        self.history_limit = history_limit
+        self.evictions = 0
+        self._blobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def load(self, session_id, session):
+        """
+        Fills `session` and returns the history, or None for an unknown id.
+        """
+        with self._lock:
+            data = self._blobs.get(session_id)
+            if data is None:
+                return None
+            self._blobs.move_to_end(session_id)
+        return unpack(data, session)
+
+    def save(self, session_id, session, history=()):
+        data = pack(session, history, self.history_limit)
+        with self._lock:
+            self._blobs[session_id] = data
+            self._blobs.move_to_end(session_id)
+            while len(self._blobs) > self.maxsize:
+                self._blobs.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id):
+        with self._lock:
+            self._blobs.pop(session_id, None)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"sessions": len(self._blobs), "bytes": sum(len(data) for data in self._blobs.values()),
+                "evictions": self.evictions}
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+UPSERT = "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)"
+
+
+def connect(path):
+    """
+    Opens the session database in WAL mode, creating the table if needed.
+    """
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # losing the last few milliseconds of chat state on a power cut is fine;
+    # NORMAL skips the fsync on every commit
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class SQLiteSessionStore:
+    """
+    Session blobs in a SQLite database that any number of processes can
+    open at once.
+
+    save() only puts the blob in a pending dict (a session saved twice
+    before the next write is written once). The pending blobs are written
+    in one transaction when `batch_size` of them have piled up, or by a
+    background thread at most `max_delay` seconds after the first one.
+    load() looks at the pending dict first, so a process always reads its
+    own writes; other processes see them after that short delay. If the
+    background write fails (say the disk is full), the error is logged and
+    the blobs stay pending until a later tick gets them written.
+    """
+
+    def __init__(self, path, history_limit=HISTORY_LIMIT, batch_size=256, max_delay=0.05):
+        self.path = path
+        self.history_limit = history_limit
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.commits = 0
+        self.written = 0
+        self.errors = 0
+        self.last_error = None
+        self._connection = connect(path)
+        # one connection shared by the callers and the flusher thread
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._first_pending = None
+        self._closed = threading.Event()
+        self._flusher = None
+        if max_delay:
+            self._flusher = threading.Thread(target=self._flush_loop, name="session-flusher", daemon=True)
+            self._flusher.start()
+
+    def load(self, session_id, session):
+        """
+        Fills `session` and returns the history, or None for an unknown id.
+        """
+        with self._lock:
+            data = self._pending.get(session_id)
+            if data is None:
+                row = self._connection.execute(
+                    "SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                if row is None:
+                    return None
+                data = row[0]
+        return unpack(data, session)
+
+    def save(self, session_id, session, history=()):
+        data = pack(session, history, self.history_limit)
+        with self._lock:
+            if not self._pending:
+                self._first_pending = time.monotonic()
+            self._pending[session_id] = data
+            if len(self._pending) >= self.batch_size or not self.max_delay:
+                self._write_pending()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._pending.pop(session_id, None)
+            with self._connection:
+                self._connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _write_pending(self):
+        # called with the lock held
+        if not self._pending:
+            return
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                UPSERT, [(session_id, data, now) for session_id, data in self._pending.items()])
+        self.commits += 1
+        self.written += len(self._pending)
+        self._pending = {}
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.max_delay):
+            with self._lock:
+                if self._pending and time.monotonic() - self._first_pending >= self.max_delay:
+                    try:
+                        self._write_pending()
+                    except sqlite3.Error as error:
+                        # the transaction was rolled back and _pending kept;
+                        # the next tick tries again. Logged once per outage,
+                        # not once per tick
+                        if self.last_error is None:
+                            log.warning("writing %d pending sessions to %s failed, will retry: %s",
+                                        len(self._pending), self.path, error)
+                        self.errors += 1
+                        self.last_error = error
+                        continue
+                    if self.last_error is not None:
+                        log.warning("pending sessions written to %s again", self.path)
+                        self.last_error = None
+
+    def flush(self):
+        """
+        Writes every pending save now.
+        """
+        with self._lock:
+            self._write_pending()
+
+    def close(self):
+        """
+        Writes what's pending and closes the database.
+        """
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            self._write_pending()
+            self._connection.close()
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "commits": self.commits,
+            "rows_per_commit": self.written / self.commits if self.commits else 0.0,
+            "pending": len(self._pending),
+            "errors": self.errors,
+        }
+
+
+class SpillFile:
+    """
+    Sessions parked in a temporary SQLite file, each with a number the
+    caller keeps alongside (replay() keeps the next turn). take() removes
+    what it returns. The file is deleted on close().
+    """
+
+    def __init__(self, directory=None):
+        handle, self.path = tempfile.mkstemp(prefix="sessions-", suffix=".db", dir=directory)
+        os.close(handle)
+        self.parked = 0
+        self._connection = sqlite3.connect(self.path)
+        # scratch data, gone with the process anyway
+        self._connection.execute("PRAGMA journal_mode=OFF")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute(
+            "CREATE TABLE spill (session_id TEXT PRIMARY KEY, number INTEGER NOT NULL, data BLOB NOT NULL) WITHOUT ROWID")
+
+    def __len__(self):
+        return self._connection.execute("SELECT count(*) FROM spill").fetchone()[0]
+
+    def put(self, session_id, session, number):
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO spill VALUES (?, ?, ?)",
+                                     (session_id, number, pack(session, (), 0)))
+        self.parked += 1
+
+    def take(self, session_id, session):
+        """
+        Fills `session` and returns its number, or returns None if the
+        session isn't parked here.
+        """
+        row = self._connection.execute(
+            "SELECT number, data FROM spill WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        with self._connection:
+            self._connection.execute("DELETE FROM spill WHERE session_id = ?", (session_id,))
+        unpack(row[1], session)
+        return row[0]
+
+    def close(self):
+        self._connection.close()
+        os.remove(self.path)
+
+
+def open_store(path=None, **options):
+    """
+    A SQLiteSessionStore on `path`, or a MemorySessionStore without one.
+    """
+    if path:
+        return SQLiteSessionStore(path, **options)
+    return MemorySessionStore(**options)
@@ -0,0 +1,51 @@
+import pytest
+
+import bookings
+import travel_chatbot
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = travel_chatbot.enable_bookings(str(tmp_path / "bookings.db"))
+    yield ledger
+    travel_chatbot.disable_bookings()
+
+
+def test_rooms_without_a_hotel_ask_for_one(ledger):
+    session = travel_chatbot.Session("rooms")
+    travel_chatbot.respond("I want to book a hotel", session)
+    stage = session.stage
+    reply = travel_chatbot.respond("2 rooms", session)
+    assert reply in travel_chatbot.MISSING_SLOT_RESPONSES["hotel"]
+    assert session.stage == stage
+    assert session.count is None
+
+    travel_chatbot.respond("hotel 2", session)
+    travel_chatbot.respond("2 rooms", session)
+    ledger.flush()
+    [booking] = ledger.bookings_for("rooms")
+    assert (booking.item, booking.quantity) == ("Hotel 2", 2)
+
+
+def test_tickets_without_a_class_ask_for_one(ledger):
+    session = travel_chatbot.Session("tickets")
+    reply = travel_chatbot.respond("3 tickets", session)
+    assert reply in travel_chatbot.MISSING_SLOT_RESPONSES["travel_class"]
+    assert session.stage == travel_chatbot.START_STAGE
+    ledger.flush()
+    assert ledger.bookings_for("tickets") == []
+
+
+@pytest.mark.parametrize("kind, hotel, travel_class, count, missing", [
+    ("hotel", None, None, "2", "hotel"),
+    ("hotel", "hotel 9", None, "2", "hotel"),
+    ("hotel", "hotel 2", None, "lots", "count"),
+    ("hotel", "hotel 2", None, "two", None),
+    ("flight", None, None, "2", "travel_class"),
+    ("flight", None, "Economy", "2", None),
+])
+def test_missing_slot(kind, hotel, travel_class, count, missing):
+    session = travel_chatbot.Session("s")
+    session.hotel, session.travel_class = hotel, travel_class
+    assert bookings.missing_slot(kind, session, count) == missing
+    assert (bookings.quote(kind, session, count) is None) == (missing is not None)
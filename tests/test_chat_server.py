@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+
+import chat_server
+
+
+def run_slow_and_fast(monkeypatch, max_inflight):
+    """
+    Answers one slow message and a few fast ones at the same time and
+    returns (order the replies finished in, most respond() calls at once).
+    """
+    running = 0
+    most = 0
+    lock = threading.Lock()
+
+    def respond(message, session):
+        nonlocal running, most
+        with lock:
+            running += 1
+            most = max(most, running)
+        time.sleep(0.3 if message == "slow" else 0.05)
+        with lock:
+            running -= 1
+        return message
+
+    monkeypatch.setattr(chat_server, "respond", respond)
+
+    async def main():
+        server = chat_server.ChatServer(max_inflight=max_inflight, queue_timeout=5.0)
+        finished = []
+
+        async def ask(session_id, message):
+            reply, _ = await server.answer(session_id, message)
+            finished.append(reply)
+
+        try:
+            await asyncio.gather(ask("a", "slow"), *(ask(f"b{i}", f"fast{i}") for i in range(4)))
+        finally:
+            server.close()
+        return finished
+
+    return asyncio.run(main()), most
+
+
+def test_slow_reply_does_not_block_others(monkeypatch):
+    finished, _ = run_slow_and_fast(monkeypatch, max_inflight=4)
+    assert finished[-1] == "slow"
+
+
+def test_max_inflight_caps_concurrent_replies(monkeypatch):
+    _, most = run_slow_and_fast(monkeypatch, max_inflight=2)
+    assert most == 2
+
+
+def test_one_session_is_answered_in_order(monkeypatch):
+    monkeypatch.setattr(chat_server, "respond", lambda message, session: time.sleep(0.01) or message)
+
+    async def main():
+        server = chat_server.ChatServer(max_inflight=8, queue_timeout=5.0)
+        finished = []
+
+        async def ask(message):
+            reply, _ = await server.answer("same", message)
+            finished.append(reply)
+
+        try:
+            await asyncio.gather(*(ask(str(i)) for i in range(8)))
+        finally:
+            server.close()
+        return finished
+
+    assert asyncio.run(main()) == [str(i) for i in range(8)]
@@ -0,0 +1,76 @@
+import random
+import re
+
+import pytest
+
+import travel_chatbot
+from travel_chatbot import RuleDispatcher
+
+# RuleDispatcher.match() has to pick the same rule, with the same capture
+# spans, as the ordered pattern.match() loop it replaced (match_linear()).
+
+SAMPLE_MESSAGES = [
+    "hi", "hello there", "good morning",
+    "book a flight to Paris", "I want a flight from London to Paris",
+    "find me a hotel in Lahore", "I want to book a hotel",
+    "luxury", "budget-friendly please", "hotel 2", "Hotel three",
+    "one way", "round trip", "economy", "business class",
+    "I want to travel tomorrow on a flight", "emirates airlines",
+    "3 rooms", "two tickets", "i want 4 seats", "5",
+    "Karachi", "new york", "you are useless", "bye",
+    "what is the weather like?", "can you tell me a joke",
+    "12345 67890 !!", "is it possible to pay with a credit card, please?",
+    "qwertyuiop asdfghjkl zxcvbnm", "",
+]
+
+
+def fuzz_messages(count=2000, seed=1):
+    """
+    Random messages glued together from the words of the samples, digits
+    and punctuation, mangled in case and spacing.
+    """
+    rng = random.Random(seed)
+    vocabulary = " ".join(SAMPLE_MESSAGES).split()
+    vocabulary += ["0", "7", "42", "to", "from", "in", "a", "-", "?", "!", ",", "", " "]
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(1, 8))]
+        message = rng.choice((" ", "  ", "\t")).join(words)
+        if rng.random() < 0.3:
+            message = message.upper()
+        messages.append(message + rng.choice(("", "?", "!!", ".")))
+    return messages
+
+
+MESSAGES = SAMPLE_MESSAGES + [m.upper() + "?!" for m in SAMPLE_MESSAGES] + fuzz_messages()
+
+RULES = travel_chatbot.builtin_rules()
+DISPATCHERS = [("all", RULES.dispatcher)] + [
+    (stage, entry[0]) for stage, entry in sorted(RULES.stage_dispatchers.items())
+]
+
+
+@pytest.mark.parametrize("label, dispatcher", DISPATCHERS, ids=[label for label, _ in DISPATCHERS])
+def test_combined_matches_linear(label, dispatcher):
+    assert dispatcher._combined is not None
+    for message in MESSAGES:
+        clean = message.strip().rstrip("?!.")
+        assert dispatcher.match(clean) == dispatcher.match_linear(clean), message
+
+
+def test_scoped_flags_stay_with_their_pattern():
+    dispatcher = RuleDispatcher([
+        re.compile(r"hello (\w+)"),
+        re.compile(r"HELLO (\w+)", re.IGNORECASE),
+        re.compile(r"""(\d+) \s+ (rooms?)  # count, then the noun""", re.VERBOSE),
+    ])
+    assert dispatcher._combined is not None
+    for text in ("hello bob", "Hello Bob", "HELLO", "3 rooms", "3rooms", "x"):
+        assert dispatcher.match(text) == dispatcher.match_linear(text), text
+
+
+def test_backreferences_fall_back_to_the_loop():
+    dispatcher = RuleDispatcher([re.compile(r"(\w+) and \1"), re.compile(r"(?P<city>\w+)")])
+    assert dispatcher._combined is None
+    assert dispatcher.match("tea and tea") == (0, ((0, 3),))
+    assert dispatcher.match("tea and milk") == (1, ((0, 3),))
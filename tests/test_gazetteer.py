@@ -0,0 +1,28 @@
+import os
+
+import gazetteer
+import travel_chatbot
+
+
+def test_gazetteer_is_off_unless_asked_for():
+    if os.environ.get("TRAVEL_GAZETTEER", "").lower() in ("", "off"):
+        assert not travel_chatbot.USE_GAZETTEER
+
+
+def test_places_are_stretched_to_whole_names(monkeypatch):
+    # cached analyses don't know which way the gazetteer was set
+    monkeypatch.setattr(travel_chatbot, "RESPONSE_CACHE", None)
+    monkeypatch.setattr(travel_chatbot, "USE_GAZETTEER", False)
+    assert "New York" not in travel_chatbot.respond("book a flight to New York")
+    monkeypatch.setattr(travel_chatbot, "USE_GAZETTEER", True)
+    assert "New York" in travel_chatbot.respond("book a flight to New York")
+    assert "flight to tomorrow" not in travel_chatbot.respond("I need a flight for tomorrow")
+
+
+def test_load_leaves_no_cache_behind(tmp_path):
+    path = tmp_path / "places.tsv"
+    path.write_text("city\tRio de Janeiro\nairport\tGaleao\tRio de Janeiro\n", encoding="utf-8")
+    entities = gazetteer.load_gazetteer(str(path))
+    assert entities.lookup("rio de janeiro") == (["city"], "Rio de Janeiro")
+    assert entities.lookup("galeao") == (["airport"], "Rio de Janeiro")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["places.tsv"]
@@ -0,0 +1,27 @@
+import pytest
+
+import travel_chatbot
+from travel_chatbot import Reflector
+
+
+@pytest.mark.parametrize("text, reflected", [
+    ("my home", "your home"),
+    ("Paris", "Paris"),
+    ("you said i'm going to love your city, me too", "I said you're going to love my city, you too"),
+    ("call ME,  (you)\tx-me", "call you, (I) x-you"),
+    ("'me' minefield", "'me' minefield"),
+    ("", ""),
+])
+def test_reflect(text, reflected):
+    assert travel_chatbot.reflect(text) == reflected
+    # a second time comes from the word cache and must not change
+    assert travel_chatbot.reflect(text) == reflected
+
+
+def test_word_cache_is_per_table_and_bounded():
+    reflector = Reflector({"me": "thee"})
+    reflector.words.max_words = 3
+    assert reflector("me and me") == "thee and thee"
+    assert travel_chatbot.reflect("me") == "you"
+    assert reflector("one two three four") == "one two three four"
+    assert len(reflector.words) <= 3
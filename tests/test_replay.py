@@ -0,0 +1,43 @@
+import json
+import random
+
+import pytest
+
+import travel_chatbot
+
+CONVERSATION = [
+    "hi", "I want to book a hotel", "Lahore", "luxury", "hotel 2", "3",
+    "book a flight", "Paris", "round trip", "economy", "2", "bye",
+]
+
+
+@pytest.fixture(scope="module")
+def transcript(tmp_path_factory):
+    # 60 conversations, interleaved, some left open and picked up much later
+    rng = random.Random(0)
+    progress = {f"s{i}": 0 for i in range(60)}
+    lines = []
+    while progress:
+        session_id = rng.choice(sorted(progress))
+        lines.append({"session": session_id, "message": CONVERSATION[progress[session_id]]})
+        progress[session_id] += 1
+        if progress[session_id] == len(CONVERSATION):
+            del progress[session_id]
+    path = tmp_path_factory.mktemp("replay") / "transcript.jsonl"
+    path.write_text("".join(json.dumps(line) + "\n" for line in lines), encoding="utf-8")
+    return path
+
+
+def replayed(transcript, tmp_path, **options):
+    out = tmp_path / "replies.jsonl"
+    travel_chatbot.replay(str(transcript), str(out), **options)
+    with open(out, encoding="utf-8") as f:
+        return sorted((r["session"], r["turn"], r["reply"]) for r in map(json.loads, f))
+
+
+def test_replay_does_not_depend_on_cap_chunks_or_workers(transcript, tmp_path):
+    expected = replayed(transcript, tmp_path, workers=1, chunk_size=500)
+    assert len({(session, turn) for session, turn, _ in expected}) == len(expected)
+    for workers, chunk_size, max_sessions in ((2, 37, 5), (3, 100, 5), (2, 7, 1)):
+        assert replayed(transcript, tmp_path, workers=workers, chunk_size=chunk_size,
+                        max_sessions=max_sessions) == expected
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+import travel_chatbot
+from travel_chatbot import RuleFileError
+
+
+def test_exported_rules_load_back_the_same(tmp_path):
+    path = tmp_path / "rules.json"
+    builtin = travel_chatbot.builtin_rules()
+    travel_chatbot.save_rules(builtin, str(path))
+    loaded = travel_chatbot.load_rules(str(path))
+    assert loaded.to_dict() == builtin.to_dict()
+    assert [p.pattern for p in loaded.patterns] == [p.pattern for p in builtin.patterns]
+    assert [p.flags for p in loaded.patterns] == [p.flags for p in builtin.patterns]
+    assert not list(tmp_path.glob("__pycache__/*"))
+
+
+@pytest.mark.parametrize("pairs, message", [
+    ("number", "expected a list"),
+    ([5], "is not a [match, answer] pair"),
+    (["ab"], "is not a [match, answer] pair"),
+    ([["number", "rooms_exact", "number"]], "is not a [match, answer] pair"),
+    ([["number", "nope"]], "unknown rule name(s) ['nope']"),
+])
+def test_bad_stage_pairs_are_rule_file_errors(pairs, message):
+    data = json.loads(json.dumps(travel_chatbot.builtin_rules().to_dict()))
+    data["stages"]["hotel_rooms"] = pairs
+    with pytest.raises(RuleFileError) as error:
+        travel_chatbot.RuleSet.from_dict(data)
+    assert "stages.hotel_rooms" in str(error.value)
+    assert message in str(error.value)
@@ -1,5 +1,21 @@
 import re
 import random
+import os
+import zlib
+import time
+import string
+import hashlib
+import itertools
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import bookings
+import gazetteer
+import session_store
 
 # =======================================================================
 # ELIZA-Style Travel Assistance Chatbot
@@ -32,14 +48,108 @@ REFLECTIONS = {
     "you'd": "I'd"
 }
 
-def reflect(text):
+class _ReflectedWords(dict):
+    """
+    Word -> reflected word, filled in by the Reflector the first time a
+    word is seen and emptied once it holds max_words.
+    """
+
+    def __init__(self, reflect_word, max_words):
+        dict.__init__(self)
+        self.reflect_word = reflect_word
+        self.max_words = max_words
+
+    def __missing__(self, word):
+        if len(self) >= self.max_words:
+            self.clear()
+        swapped = self[word] = self.reflect_word(word)
+        return swapped
+
+class Reflector:
+    """
+    Swaps pronouns word by word. Splitting on whitespace also collapses
+    it, each word is looked up lower-cased in a dict, and only words with
+    punctuation stuck to them go through the compiled regex. Words that
+    aren't reflected keep their case ("Paris" stays "Paris"), and
+    punctuation doesn't stop a word from being reflected ("me," becomes
+    "you,").
+
+    The answer for each word is remembered, so once a word has been seen
+    reflecting it is a single dict lookup - the same work the plain
+    lowercase split/join did, without the lower().
+    """
+
+    max_words = 10000
+
+    def __init__(self, reflections):
+        self.reflections = {word.lower(): swapped for word, swapped in reflections.items()}
+        # longest first, so "i'm" wins over "i"; the lookarounds keep us
+        # from matching inside bigger words ("mine" in "minefield")
+        words = "|".join(re.escape(word) for word in sorted(self.reflections, key=len, reverse=True))
+        self.pattern = re.compile(r"(?<![\w'])(" + words + r")(?![\w'])", re.IGNORECASE)
+        self.words = _ReflectedWords(self.reflect_word, self.max_words)
+
+    def _swap(self, match):
+        return self.reflections[match.group(1).lower()]
+
+    def reflect_word(self, word):
+        """
+        Reflects a single word (no whitespace), bypassing the cache.
+        """
+        lowered = word.lower()
+        swapped = self.reflections.get(lowered)
+        if swapped is not None:
+            return swapped
+        if lowered.isalnum():
+            return word
+        # "me," / "(you)" - let the regex find the word inside
+        return self.pattern.sub(self._swap, word)
+
+    def __call__(self, text):
+        return " ".join(map(self.words.__getitem__, text.split()))
+
+    def many(self, texts):
+        """
+        Reflects a batch of texts (for the replay and batch paths).
+        """
+        return [self(text) for text in texts]
+
+DEFAULT_REFLECTOR = Reflector(REFLECTIONS)
+
+# Reflectors built for other tables, by id() of the table. The table is kept
+# alongside so its id can't be reused while the entry exists; a table is
+# expected not to change once it has been passed in.
+REFLECTOR_CACHE_SIZE = 32
+_REFLECTORS = {id(REFLECTIONS): (REFLECTIONS, DEFAULT_REFLECTOR)}
+
+def reflector_for(reflections=None):
     """
-    Splits the extracted text into words, swaps pronouns using REFLECTIONS,
-    and returns the reflected string.
+    The Reflector for a reflections table (DEFAULT_REFLECTOR for None),
+    built once per table.
     """
-    words = text.lower().split()
-    reflected_words = [REFLECTIONS.get(word, word) for word in words]
-    return " ".join(reflected_words)
+    if reflections is None:
+        return DEFAULT_REFLECTOR
+    entry = _REFLECTORS.get(id(reflections))
+    if entry is None or entry[0] is not reflections:
+        while len(_REFLECTORS) >= REFLECTOR_CACHE_SIZE:
+            del _REFLECTORS[next(iter(_REFLECTORS))]
+        entry = _REFLECTORS[id(reflections)] = (reflections, Reflector(reflections))
+    return entry[1]
+
+def reflect(text, reflections=None):
+    """
+    Swaps pronouns in the extracted text using REFLECTIONS (or the given
+    reflections table), collapsing whitespace, and returns the result.
+    """
+    if reflections is None:
+        return DEFAULT_REFLECTOR(text)
+    return reflector_for(reflections)(text)
+
+def reflect_many(texts, reflections=None):
+    """
+    reflect() for a batch of texts.
+    """
+    return reflector_for(reflections).many(texts)
 
 # =======================================================================
 # PATTERN MATCHING RULES
@@ -131,11 +241,11 @@ RULES = {
     ],
     
     # 6. HOTELS: Catching Luxury vs Budget preference
-    re.compile(r'.*\bluxury\b.*', re.IGNORECASE): [
+    re.compile(r'.*\b(luxury)\b.*', re.IGNORECASE): [
         "For luxury accommodations, we offer Hotel 1, Hotel 2, and Hotel 3. The price is 15000Rs/room. Which hotel would you prefer?",
         "Our luxury options include Hotel 1, Hotel 2, and Hotel 3 at 15000Rs per room. Which one of these catches your eye?"
     ],
-    re.compile(r'.*\bbudget(?:-friendly)?\b.*', re.IGNORECASE): [
+    re.compile(r'.*\b(budget)(?:-friendly)?\b.*', re.IGNORECASE): [
         "For budget-friendly stays, we have Hotel 4, Hotel 5, and Hotel 6. The price is 8000Rs/room. Which hotel would you prefer?",
         "Our budget options are Hotel 4, Hotel 5, and Hotel 6 at 8000Rs per room. Which of these would you like to book?"
     ],
@@ -191,47 +301,1226 @@ DEFAULT_RESPONSES = [
     "I am a travel booking bot. Are you interested in sorting out your flights or your accommodation today?"
 ]
 
-def respond(user_input):
+# =======================================================================
+# COMPILED INTENT DISPATCHER
+# =======================================================================
+# Calling `pattern.match()` once per rule means a message that matches
+# nothing pays for every single rule before it reaches DEFAULT_RESPONSES.
+# Instead, all the rules are merged into one big alternation where each
+# rule is wrapped in its own named group:  (?P<r0>...)|(?P<r1>...)|...
+# The regex engine tries the alternatives left to right and stops at the
+# first one that matches, which is exactly the first-match order of the
+# RULES loop, but the whole scan is a single C-level call.
+# =======================================================================
+
+# inline flags that can be scoped to a single alternative, e.g. (?i:...)
+_SCOPED_FLAGS = (
+    (re.IGNORECASE, "i"),
+    (re.MULTILINE, "m"),
+    (re.DOTALL, "s"),
+    (re.VERBOSE, "x"),
+)
+
+# numbered/named backreferences would point at the wrong group once merged
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+class RuleDispatcher:
+    """
+    Matches text against an ordered list of compiled patterns in one pass.
+    Returns (rule_index, spans) for the first pattern that matches, where
+    spans holds the (start, end) of every capture group of that pattern
+    ((-1, -1) for groups that did not take part), or None.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+
+        # maps the outer group number of each alternative to
+        # (rule index, first inner group, one past the last inner group)
+        self._rule_for_group = {}
+
+        parts = []
+        group = 1
+        for index, pattern in enumerate(self.patterns):
+            flags = "".join(letter for flag, letter in _SCOPED_FLAGS if pattern.flags & flag)
+            # a trailing newline keeps a verbose-mode comment from eating the ')'
+            body = pattern.pattern + "\n" if pattern.flags & re.VERBOSE else pattern.pattern
+            parts.append("(?P<r%d>(?%s:%s))" % (index, flags, body) if flags else "(?P<r%d>%s)" % (index, body))
+            self._rule_for_group[group] = (index, group + 1, group + 1 + pattern.groups)
+            group += 1 + pattern.groups
+
+        self._combined = None
+        if not any(p.groupindex or _BACKREFERENCE.search(p.pattern) for p in self.patterns):
+            try:
+                self._combined = re.compile("|".join(parts))
+            except re.error:
+                # fall back to the plain ordered loop if the merge doesn't compile
+                self._combined = None
+
+    def match(self, text):
+        """
+        Returns (rule_index, spans) for the first matching rule, or None.
+        """
+        if self._combined is None:
+            return self.match_linear(text)
+
+        match = self._combined.match(text)
+        if match is None:
+            return None
+
+        # the wrapper group closes last, so lastindex always points at it
+        index, first, stop = self._rule_for_group[match.lastindex]
+        return index, tuple(match.span(g) for g in range(first, stop))
+
+    def match_linear(self, text):
+        """
+        The original ordered loop: one `pattern.match()` per rule.
+        Kept as the reference implementation and as the fallback.
+        """
+        for index, pattern in enumerate(self.patterns):
+            match = pattern.match(text)
+            if match:
+                return index, tuple(match.span(g) for g in range(1, pattern.groups + 1))
+        return None
+
+# =======================================================================
+# DIALOGUE STATE (PER-SESSION FUNNEL)
+# =======================================================================
+# Without any state, a bare "3" can only hit the generic-numbers rule
+# because the bot has no idea whether it just asked about rooms or about
+# tickets. A Session remembers which step of the funnel the user is on
+# and the slots filled so far:
+#   HOTELS:  hotel_city -> hotel_tier -> hotel_pick -> hotel_rooms
+#   FLIGHTS: flight_dest -> flight_trip -> flight_class -> flight_tickets
+# At each stage the rules that can come next are tried first; if none of
+# them match (the user changed topic) the other rules follow in the same
+# regex pass.
+# =======================================================================
+
+# Names for the rules above, in the same order as RULES
+RULE_NAMES = [
+    "rooms_exact", "tickets_exact", "rooms_any", "tickets_any", "number",
+    "one_way", "round_trip", "travel_date", "airline", "economy", "business",
+    "flight_route", "flight_dest",
+    "hotel_pick", "luxury", "budget", "hotel_city",
+    "book_hotel", "book_flight", "city_only",
+    "greeting", "frustrated", "farewell",
+]
+
+# Which session slot each capture group of a rule fills (in group order)
+RULE_SLOTS = {
+    "rooms_exact": ("count",),
+    "tickets_exact": ("count",),
+    "rooms_any": ("count",),
+    "tickets_any": ("count",),
+    "number": ("count",),
+    "one_way": ("trip_type",),
+    "round_trip": ("trip_type",),
+    "travel_date": ("date",),
+    "airline": ("airline",),
+    "economy": ("travel_class",),
+    "business": ("travel_class",),
+    "flight_route": ("origin", "destination"),
+    "flight_dest": ("destination",),
+    "hotel_pick": ("hotel",),
+    "luxury": ("hotel_tier",),
+    "budget": ("hotel_tier",),
+    "hotel_city": ("city",),
+    "city_only": ("city",),
+}
+
+# The funnel stage the conversation moves to after each rule answers
+START_STAGE = "start"
+RULE_NEXT_STAGE = {
+    "rooms_exact": START_STAGE,
+    "tickets_exact": START_STAGE,
+    "rooms_any": START_STAGE,
+    "tickets_any": START_STAGE,
+    "number": START_STAGE,
+    "one_way": "flight_class",
+    "round_trip": "flight_class",
+    "travel_date": "flight_trip",
+    "airline": "flight_class",
+    "economy": "flight_tickets",
+    "business": "flight_tickets",
+    "flight_route": "flight_trip",
+    "flight_dest": "flight_trip",
+    "hotel_pick": "hotel_rooms",
+    "luxury": "hotel_pick",
+    "budget": "hotel_pick",
+    "hotel_city": "hotel_tier",
+    "book_hotel": "hotel_city",
+    "book_flight": "flight_dest",
+    "city_only": START_STAGE,
+    "greeting": START_STAGE,
+    "frustrated": START_STAGE,
+    "farewell": START_STAGE,
+}
+
+# Rules worth trying at each stage, as (rule to match, rule to answer as).
+# Answering as a different rule is what lets a bare "3" book rooms when
+# the bot just asked for a room count, or a bare "Paris" become a flight
+# destination when it just asked where the user is flying to.
+STAGE_RULES = {
+    "hotel_city": (
+        ("greeting", "greeting"), ("farewell", "farewell"),
+        ("hotel_city", "hotel_city"), ("city_only", "hotel_city"),
+    ),
+    "hotel_tier": (
+        ("luxury", "luxury"), ("budget", "budget"),
+    ),
+    "hotel_pick": (
+        ("hotel_pick", "hotel_pick"),
+    ),
+    "hotel_rooms": (
+        ("rooms_exact", "rooms_exact"), ("rooms_any", "rooms_any"), ("number", "rooms_exact"),
+    ),
+    "flight_dest": (
+        ("greeting", "greeting"), ("farewell", "farewell"),
+        ("flight_route", "flight_route"), ("flight_dest", "flight_dest"), ("city_only", "flight_dest"),
+    ),
+    "flight_trip": (
+        ("one_way", "one_way"), ("round_trip", "round_trip"), ("travel_date", "travel_date"),
+        ("airline", "airline"), ("economy", "economy"), ("business", "business"),
+    ),
+    "flight_class": (
+        ("economy", "economy"), ("business", "business"),
+        ("one_way", "one_way"), ("round_trip", "round_trip"), ("airline", "airline"),
+    ),
+    "flight_tickets": (
+        ("tickets_exact", "tickets_exact"), ("tickets_any", "tickets_any"), ("number", "tickets_exact"),
+    ),
+}
+
+class Session:
+    """
+    The dialogue state of one conversation: the current funnel stage and
+    the slots filled so far. Uses __slots__ so a single process can hold
+    hundreds of thousands of them.
+    """
+
+    __slots__ = (
+        "session_id", "stage", "selector",
+        "origin", "destination", "date", "airline", "travel_class", "trip_type",
+        "city", "hotel_tier", "hotel", "count",
+    )
+
+    SLOT_NAMES = __slots__[3:]
+
+    def __init__(self, session_id=None, selector=None):
+        self.session_id = session_id
+        self.stage = START_STAGE
+        # how this session picks among a rule's responses (None = the default)
+        self.selector = selector
+        for slot in self.SLOT_NAMES:
+            setattr(self, slot, None)
+
+    def update(self, slot_names, next_stage, values):
+        """
+        Fills the slots of the rule that answered and moves to its next
+        stage (if it has one). `values` are the captured groups in order
+        (None for groups that didn't take part in the match).
+        """
+        for slot, value in zip(slot_names, values):
+            if value is not None:
+                setattr(self, slot, value)
+        if next_stage is not None:
+            self.stage = next_stage
+
+    def filled_slots(self):
+        """
+        Returns a dict of the slots that have a value.
+        """
+        return {slot: getattr(self, slot) for slot in self.SLOT_NAMES if getattr(self, slot) is not None}
+
+    def __repr__(self):
+        return f"Session(id={self.session_id!r}, stage={self.stage!r}, slots={self.filled_slots()!r})"
+
+def match_rule(clean_input, session=None, rules=None):
+    """
+    Returns (rule_index, spans) for the rule that should answer, or None.
+    With a session, the rules for its current stage are tried first.
+    Uses the active rule set unless another RuleSet is given.
+    """
+    if rules is None:
+        rules = ACTIVE_RULES
+    metrics = METRICS
+    if session is not None:
+        stage_rules = rules.stage_dispatchers.get(session.stage)
+        if stage_rules is not None:
+            # the stage dispatcher ends with all the other rules, so a
+            # miss here is a miss everywhere
+            dispatcher, rule_names, answers = stage_rules
+            if metrics is None:
+                hit = dispatcher.match(clean_input)
+            else:
+                hit = metrics.match(dispatcher, rule_names, clean_input)
+            return (answers[hit[0]], hit[1]) if hit else None
+
+    if metrics is None:
+        return rules.dispatcher.match(clean_input)
+    return metrics.match(rules.dispatcher, rules.names, clean_input)
+
+# =======================================================================
+# RESPONSE SELECTION & TEMPLATE RENDERING
+# =======================================================================
+# Every rule has a few interchangeable replies. Which one is used is up
+# to a selector:
+#   RandomSelector - picks with an RNG; give each session its own seeded
+#                    random.Random to make a conversation reproducible
+#   HashSelector   - picks from a hash of the input, so the same message
+#                    always gets the same reply (cache and diff friendly)
+# Templates are parsed once at import into literal text and slot numbers,
+# so rendering a reply is a join instead of a str.format parse.
+# =======================================================================
+
+class ResponseTemplate:
+    """
+    A reply template pre-split into literal segments and positional slots.
+    """
+
+    __slots__ = ("text", "literals", "fields", "needed")
+
+    def __init__(self, text):
+        self.text = text
+        literals = []
+        fields = []
+        pending = ""
+        auto_index = 0
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            # escaped braces come back as extra literal-only chunks
+            pending += literal
+            if field is None:
+                continue
+            if spec or conversion or not (field == "" or field.isdigit()):
+                # anything fancier than {0} / {} is left to str.format
+                literals = None
+                break
+            if field == "":
+                field = auto_index
+                auto_index += 1
+            literals.append(pending)
+            fields.append(int(field))
+            pending = ""
+
+        if literals is not None:
+            literals.append(pending)
+        self.literals = literals
+        self.fields = fields if literals is not None else None
+        self.needed = max(self.fields) + 1 if self.fields else 0
+
+    def render(self, args):
+        """
+        Fills the slots with args. Like the old str.format call, a template
+        asking for more groups than were captured comes back unformatted.
+        """
+        if self.literals is None:
+            try:
+                return self.text.format(*args)
+            except IndexError:
+                return self.text
+        if len(args) < self.needed:
+            return self.text
+
+        literals = self.literals
+        parts = [literals[0]]
+        for position, field in enumerate(self.fields, 1):
+            parts.append(args[field])
+            parts.append(literals[position])
+        return "".join(parts)
+
+    def __repr__(self):
+        return f"ResponseTemplate({self.text!r})"
+
+class RandomSelector:
+    """
+    Picks a reply with an RNG: a seeded random.Random per session for
+    reproducible conversations, or the global `random` module by default.
+    """
+
+    __slots__ = ("rng",)
+
+    def __init__(self, seed=None, rng=None):
+        self.rng = rng if rng is not None else random.Random(seed)
+
+    def pick(self, options, key):
+        return self.rng.choice(options)
+
+class HashSelector:
+    """
+    Picks a reply from a stable hash of the (cleaned, lowercased) input,
+    so identical messages always get identical replies.
+    """
+
+    __slots__ = ("salt",)
+
+    def __init__(self, salt=""):
+        self.salt = salt
+
+    def pick(self, options, key):
+        return options[zlib.crc32((self.salt + key.lower()).encode("utf-8")) % len(options)]
+
+# the original behaviour: random.choice on the global random module
+DEFAULT_SELECTOR = RandomSelector(rng=random)
+
+# =======================================================================
+# RESPONSE CACHE
+# =======================================================================
+# Most traffic is the same handful of messages ("hi", "economy", "2 rooms",
+# "bye"), so an optional LRU cache remembers, per normalized input
+# (stripped, trailing ?!. removed, lowercased), which rule answered, the
+# capture spans and the already-reflected groups. A hit skips the rule
+# scan and reflect() (unless the casing differs from the cached message,
+# since reflection keeps case); the template is still picked per call, so replies
+# keep their variety. The funnel stage is part of the key because it
+# changes which rules are tried. This relies on the rules being
+# case-insensitive, as all of RULES are.
+#
+# Turn it on with enable_response_cache(), or by setting the
+# TRAVEL_CACHE_SIZE (and optionally TRAVEL_CACHE_TTL) environment variable.
+# =======================================================================
+
+class ResponseCache:
+    """
+    A thread-safe LRU cache with an optional TTL (in seconds) and
+    hit/miss/eviction counters.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the counters as a dict.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+RESPONSE_CACHE = None
+
+def enable_response_cache(maxsize=1024, ttl=None):
+    """
+    Puts a fresh ResponseCache in front of respond() and returns it.
+    """
+    global RESPONSE_CACHE
+    RESPONSE_CACHE = ResponseCache(maxsize, ttl)
+    return RESPONSE_CACHE
+
+def disable_response_cache():
+    global RESPONSE_CACHE
+    RESPONSE_CACHE = None
+
+if os.environ.get("TRAVEL_CACHE_SIZE"):
+    enable_response_cache(
+        int(os.environ["TRAVEL_CACHE_SIZE"]),
+        float(os.environ["TRAVEL_CACHE_TTL"]) if os.environ.get("TRAVEL_CACHE_TTL") else None,
+    )
+
+# =======================================================================
+# HOT-PATH INSTRUMENTATION
+# =======================================================================
+# Opt-in counters to find out which rules fire, how often messages fall
+# through to DEFAULT_RESPONSES, and which regex eats the CPU time. While
+# enabled, matching goes through the plain ordered loop (same result as
+# the combined dispatcher) so every pattern can be timed on its own.
+# When disabled, respond() only pays for one `is None` check.
+#
+#   metrics = enable_metrics()
+#   ...
+#   print(metrics.to_prometheus())   # or metrics.to_json()
+# =======================================================================
+
+# histogram bucket upper bounds, in seconds (1 microsecond .. 100 milliseconds)
+LATENCY_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 1e-1,
+)
+
+class RuleMetrics:
+    """
+    Per-rule attempt/hit counters and match-time histograms, plus the
+    number of replies and how many of them were fallbacks. Thread-safe.
+    """
+
+    def __init__(self, rule_names=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # rule name -> [attempts, hits, seconds, histogram]; keyed by name so
+        # the numbers survive a rule file reload that reorders the rules
+        self.rules = {}
+        for name in rule_names:
+            self._stats(name)
+        self.responses = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def _stats(self, name):
+        stats = self.rules.get(name)
+        if stats is None:
+            # one extra bucket at the end for +Inf
+            stats = self.rules[name] = [0, 0, 0.0, [0] * (len(self.buckets) + 1)]
+        return stats
+
+    def match(self, dispatcher, rule_names, text):
+        """
+        Same contract as dispatcher.match(), but tries the patterns one by
+        one and records each attempt.
+        """
+        timings = []
+        hit = None
+        clock = time.perf_counter
+        for position, pattern in enumerate(dispatcher.patterns):
+            start = clock()
+            match = pattern.match(text)
+            timings.append((rule_names[position], clock() - start, match is not None))
+            if match:
+                hit = position, tuple(match.span(g) for g in range(1, pattern.groups + 1))
+                break
+
+        buckets = self.buckets
+        with self._lock:
+            for name, elapsed, matched in timings:
+                stats = self._stats(name)
+                stats[0] += 1
+                stats[1] += matched
+                stats[2] += elapsed
+                stats[3][bisect_left(buckets, elapsed)] += 1
+        return hit
+
+    def record_response(self, fallback):
+        with self._lock:
+            self.responses += 1
+            self.fallbacks += fallback
+
+    def snapshot(self):
+        """
+        Returns all the numbers as a plain dict.
+        """
+        with self._lock:
+            rules = {}
+            for name, (attempts, hits, seconds, histogram) in self.rules.items():
+                rules[name] = {
+                    "attempts": attempts,
+                    "hits": hits,
+                    "seconds": seconds,
+                    "histogram": dict(zip([str(b) for b in self.buckets] + ["+Inf"], histogram)),
+                }
+            return {
+                "responses": self.responses,
+                "fallbacks": self.fallbacks,
+                "fallback_rate": self.fallbacks / self.responses if self.responses else 0.0,
+                "rules": rules,
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """
+        Returns the snapshot in the Prometheus text exposition format.
+        """
+        data = self.snapshot()
+        lines = [
+            "# HELP travel_responses_total Replies produced by respond().",
+            "# TYPE travel_responses_total counter",
+            f"travel_responses_total {data['responses']}",
+            "# HELP travel_fallbacks_total Replies that fell through to DEFAULT_RESPONSES.",
+            "# TYPE travel_fallbacks_total counter",
+            f"travel_fallbacks_total {data['fallbacks']}",
+            "# HELP travel_rule_attempts_total Times a rule pattern was tried.",
+            "# TYPE travel_rule_attempts_total counter",
+        ]
+        lines += [f'travel_rule_attempts_total{{rule="{name}"}} {rule["attempts"]}' for name, rule in data["rules"].items()]
+        lines += [
+            "# HELP travel_rule_hits_total Times a rule pattern matched.",
+            "# TYPE travel_rule_hits_total counter",
+        ]
+        lines += [f'travel_rule_hits_total{{rule="{name}"}} {rule["hits"]}' for name, rule in data["rules"].items()]
+        lines += [
+            "# HELP travel_rule_match_seconds Time spent in pattern.match() per rule.",
+            "# TYPE travel_rule_match_seconds histogram",
+        ]
+        for name, rule in data["rules"].items():
+            cumulative = 0
+            for bound, count in rule["histogram"].items():
+                cumulative += count
+                lines.append(f'travel_rule_match_seconds_bucket{{rule="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'travel_rule_match_seconds_sum{{rule="{name}"}} {rule["seconds"]}')
+            lines.append(f'travel_rule_match_seconds_count{{rule="{name}"}} {rule["attempts"]}')
+        return "\n".join(lines) + "\n"
+
+METRICS = None
+
+def enable_metrics():
+    """
+    Starts recording per-rule metrics and returns the RuleMetrics object.
+    """
+    global METRICS
+    METRICS = RuleMetrics(ACTIVE_RULES.names)
+    return METRICS
+
+def disable_metrics():
+    global METRICS
+    METRICS = None
+
+# =======================================================================
+# RULE FILES (DECLARATIVE RULES, HOT RELOAD)
+# =======================================================================
+# Everything respond() needs from the tables above (patterns, templates,
+# reflections, fallbacks, slots, stages and the compiled dispatchers) is
+# bundled in one RuleSet. The built-in one comes from the literals in
+# this file. Another one can be loaded from a JSON (or YAML, if PyYAML is
+# installed) rule file shaped like the one save_rules() writes:
+#
+#   {"rules": [{"name": "greeting", "pattern": "^\\b(hello|hi)\\b.*",
+#               "flags": ["IGNORECASE"], "responses": ["Hello!"],
+#               "slots": [], "stage": "start"}, ...],
+#    "stages": {"hotel_rooms": [["number", "rooms_exact"], ...]},
+#    "reflections": {...}, "default_responses": [...]}
+#
+# The built-in tables are the one source of truth; a rule file to edit
+# starts as `--export-rules FILE`, which writes them out. Loading always
+# parses and compiles the file: compiling the regexes is most of the work
+# and a cache couldn't skip it, since `re` patterns recompile when they
+# are unpickled. Swapping the active rules is a single reference assignment,
+# and respond() reads that reference once per call, so a reload never
+# mixes old and new rules within one reply.
+# =======================================================================
+
+class RuleFileError(ValueError):
+    """
+    Raised when a rule file can't be read or doesn't validate.
+    """
+
+# regex flags a rule file may ask for
+RULE_FLAGS = {
+    "IGNORECASE": re.IGNORECASE,
+    "MULTILINE": re.MULTILINE,
+    "DOTALL": re.DOTALL,
+    "VERBOSE": re.VERBOSE,
+    "ASCII": re.ASCII,
+}
+
+class RuleSet:
     """
-    Takes the user input, matches it against predefined regex patterns,
-    extracts info using capture groups, reflects pronouns, and formats 
+    A validated, precompiled set of rules ready for respond().
+    Build one with RuleSet.from_dict() or load_rules().
+    """
+
+    def __init__(self, names, patterns, responses, slots, next_stage, stage_rules,
+                 reflections, default_responses, source=None):
+        self.names = list(names)
+        self.patterns = list(patterns)
+        self.responses = [list(r) for r in responses]
+        self.slots = dict(slots)
+        self.next_stage = dict(next_stage)
+        self.stage_rules = {stage: [tuple(pair) for pair in pairs] for stage, pairs in stage_rules.items()}
+        self.reflections = dict(reflections)
+        self.reflector = Reflector(self.reflections)
+        self.default_responses = list(default_responses)
+        self.source = source
+        self.digest = None
+        self.version = 0
+
+        self.index = {name: position for position, name in enumerate(self.names)}
+        self.dispatcher = RuleDispatcher(self.patterns)
+        self.templates = [[ResponseTemplate(text) for text in r] for r in self.responses]
+        self.default_templates = [ResponseTemplate(text) for text in self.default_responses]
+
+        # one dispatcher per stage, plus the rule name of each of its
+        # patterns and the rule index each hit answers as
+        self.stage_dispatchers = {stage: self._stage_dispatcher(pairs) for stage, pairs in self.stage_rules.items()}
+
+    def _stage_dispatcher(self, pairs):
+        # the stage's rules come first and every other rule follows in the
+        # usual order, so a user who changes topic costs one pass instead
+        # of a failed stage pass plus a full one. The stage's own patterns
+        # are left out of the tail: they can't match there if they didn't
+        # match up front
+        tried = {self.index[match] for match, _ in pairs}
+        rest = [index for index in range(len(self.names)) if index not in tried]
+        return (
+            RuleDispatcher([self.patterns[self.index[match]] for match, _ in pairs] + [self.patterns[i] for i in rest]),
+            [match for match, _ in pairs] + [self.names[i] for i in rest],
+            [self.index[answer] for _, answer in pairs] + rest,
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_dict(cls, data, source=None):
+        """
+        Validates a parsed rule file and compiles it.
+        Raises RuleFileError pointing at the first problem found.
+        """
+        if not isinstance(data, dict) or not isinstance(data.get("rules"), list) or not data["rules"]:
+            raise RuleFileError("a rule file needs a non-empty \"rules\" list")
+
+        names, patterns, responses, slots, next_stage = [], [], [], {}, {}
+        for position, rule in enumerate(data["rules"]):
+            where = f"rules[{position}]"
+            if not isinstance(rule, dict):
+                raise RuleFileError(f"{where}: expected an object")
+            name = rule.get("name")
+            if not isinstance(name, str) or not name:
+                raise RuleFileError(f"{where}: missing \"name\"")
+            where = f"{where} ({name})"
+            if name in names:
+                raise RuleFileError(f"{where}: duplicate rule name")
+
+            flags = 0
+            for flag in rule.get("flags", []):
+                if flag not in RULE_FLAGS:
+                    raise RuleFileError(f"{where}: unknown flag {flag!r}")
+                flags |= RULE_FLAGS[flag]
+            try:
+                pattern = re.compile(rule["pattern"], flags)
+            except KeyError:
+                raise RuleFileError(f"{where}: missing \"pattern\"")
+            except (re.error, TypeError) as error:
+                raise RuleFileError(f"{where}: pattern doesn't compile: {error}")
+
+            texts = rule.get("responses")
+            if not isinstance(texts, list) or not texts or not all(isinstance(t, str) for t in texts):
+                raise RuleFileError(f"{where}: \"responses\" must be a non-empty list of strings")
+
+            rule_slots = tuple(rule.get("slots", ()))
+            unknown = [slot for slot in rule_slots if slot not in Session.SLOT_NAMES]
+            if unknown:
+                raise RuleFileError(f"{where}: unknown slot(s) {unknown}")
+            if len(rule_slots) > pattern.groups:
+                raise RuleFileError(f"{where}: {len(rule_slots)} slots but only {pattern.groups} capture groups")
+
+            names.append(name)
+            patterns.append(pattern)
+            responses.append(texts)
+            if rule_slots:
+                slots[name] = rule_slots
+            if rule.get("stage") is not None:
+                next_stage[name] = str(rule["stage"])
+
+        stage_rules = data.get("stages", {})
+        if not isinstance(stage_rules, dict):
+            raise RuleFileError("\"stages\" must map a stage to [match, answer] rule name pairs")
+        for stage, pairs in stage_rules.items():
+            where = f"stages.{stage}"
+            if not isinstance(pairs, list):
+                raise RuleFileError(f"{where}: expected a list of [match, answer] rule name pairs")
+            for position, pair in enumerate(pairs):
+                if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+                    raise RuleFileError(f"{where}[{position}]: {pair!r} is not a [match, answer] pair")
+                unknown = [name for name in pair if name not in names]
+                if unknown:
+                    raise RuleFileError(f"{where}[{position}] {pair!r}: unknown rule name(s) {unknown}")
+
+        reflections = data.get("reflections", REFLECTIONS)
+        default_responses = data.get("default_responses", DEFAULT_RESPONSES)
+        if not isinstance(reflections, dict):
+            raise RuleFileError("\"reflections\" must map words to words")
+        if not isinstance(default_responses, list) or not default_responses:
+            raise RuleFileError("\"default_responses\" must be a non-empty list")
+
+        return cls(names, patterns, responses, slots, next_stage, stage_rules,
+                   reflections, default_responses, source)
+
+    def to_dict(self):
+        """
+        The rule file form of this rule set (what save_rules() writes).
+        """
+        rules = []
+        for name, pattern, texts in zip(self.names, self.patterns, self.responses):
+            rule = {
+                "name": name,
+                "pattern": pattern.pattern,
+                "flags": [flag for flag, value in RULE_FLAGS.items() if pattern.flags & value],
+                "responses": texts,
+            }
+            if name in self.slots:
+                rule["slots"] = list(self.slots[name])
+            if name in self.next_stage:
+                rule["stage"] = self.next_stage[name]
+            rules.append(rule)
+        return {
+            "rules": rules,
+            "stages": {stage: [list(pair) for pair in pairs] for stage, pairs in self.stage_rules.items()},
+            "reflections": self.reflections,
+            "default_responses": self.default_responses,
+        }
+
+    def __repr__(self):
+        return f"RuleSet({len(self)} rules, source={self.source!r}, version={self.version})"
+
+def builtin_rules():
+    """
+    Builds the RuleSet for the literal tables in this file.
+    """
+    return RuleSet(
+        RULE_NAMES, RULES.keys(), RULES.values(), RULE_SLOTS, RULE_NEXT_STAGE, STAGE_RULES,
+        REFLECTIONS, DEFAULT_RESPONSES, source="<built-in>",
+    )
+
+def load_rules(path):
+    """
+    Reads, validates and compiles a JSON/YAML rule file.
+    """
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError as error:
+        raise RuleFileError(f"can't read {path}: {error}")
+
+    try:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuleFileError("PyYAML is needed to read YAML rule files (pip install pyyaml)")
+            data = yaml.safe_load(raw)
+        else:
+            data = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as error:
+        raise RuleFileError(f"{path}: {error}")
+    except Exception as error:
+        # yaml.YAMLError and friends
+        if isinstance(error, RuleFileError):
+            raise
+        raise RuleFileError(f"{path}: {error}")
+
+    rules = RuleSet.from_dict(data, source=path)
+    # the file's SHA-256, to tell which version of it is loaded
+    rules.digest = hashlib.sha256(raw).hexdigest()
+    return rules
+
+def save_rules(rules, path):
+    """
+    Writes a RuleSet out as a JSON rule file.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rules.to_dict(), f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+_RULE_VERSIONS = itertools.count(1)
+
+def install_rules(rules):
+    """
+    Makes `rules` the active RuleSet for every following respond() call.
+    """
+    global ACTIVE_RULES
+    rules.version = next(_RULE_VERSIONS)
+    ACTIVE_RULES = rules
+    # cached analyses belong to the old rules (the version in the cache key
+    # already keeps them apart; this just frees the memory)
+    if RESPONSE_CACHE is not None:
+        RESPONSE_CACHE.clear()
+    return rules
+
+class RuleFileWatcher:
+    """
+    Reloads a rule file into the active rules whenever it changes on disk.
+    Call check() periodically (the chat server does it on a timer).
+    A file that fails to validate is reported once and the old rules stay.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._stamp = None
+        self._failed_stamp = None
+
+    def _current_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        """
+        Returns True if new rules were installed. Raises RuleFileError the
+        first time a changed file turns out to be invalid.
+        """
+        try:
+            stamp = self._current_stamp()
+        except OSError:
+            return False
+        if stamp == self._stamp or stamp == self._failed_stamp:
+            return False
+        try:
+            rules = load_rules(self.path)
+        except RuleFileError:
+            self._failed_stamp = stamp
+            raise
+        install_rules(rules)
+        self._stamp = stamp
+        return True
+
+ACTIVE_RULES = None
+install_rules(builtin_rules())
+
+if os.environ.get("TRAVEL_RULES_FILE"):
+    install_rules(load_rules(os.environ["TRAVEL_RULES_FILE"]))
+
+# =======================================================================
+# ENTITY SPANS
+# =======================================================================
+# The place rules capture `([a-zA-Z]+)` after "to/for/in", which cuts
+# "New York" down to "New" and takes "tomorrow" for a city. After a rule
+# matches, its place and airline groups are checked against the
+# gazetteer (gazetteer.py): a group that starts inside a known name is
+# stretched to the whole name, and a place group that turns out to be a
+# date is answered by the travel_date rule instead.
+#
+# This runs on top of the regexes rather than replacing them, and costs
+# a third or more of respond()'s throughput (python bench_chatbot.py
+# gazetteer), so it is off unless TRAVEL_GAZETTEER is set: "on" for the
+# bundled gazetteer.tsv (a few hundred names), or the path of another TSV.
+# =======================================================================
+
+# which gazetteer kinds may fill each slot
+ENTITY_SLOTS = {
+    "origin": ("city", "airport"),
+    "destination": ("city", "airport"),
+    "city": ("city", "airport"),
+    "airline": ("airline",),
+}
+# the rule that answers when a place slot caught a date
+DATE_RULE = "travel_date"
+# the rule a message that is nothing but a known place answers as, when
+# no pattern took it ("Rio de Janeiro" is too long for city_only's regex)
+PLACE_RULE = "city_only"
+USE_GAZETTEER = os.environ.get("TRAVEL_GAZETTEER", "").lower() not in ("", "off")
+
+def resolve_entities(clean_input, index, spans, rules):
+    """
+    Adjusts a rule hit with the gazetteer. Returns (rule_index, spans),
+    possibly for a different rule.
+    """
+    slots = rules.slots.get(rules.names[index], ())
+    if not any(slot in ENTITY_SLOTS for slot in slots):
+        return index, spans
+    entities = gazetteer.default_gazetteer()
+
+    spans = list(spans)
+    for position, (slot, (start, end)) in enumerate(zip(slots, spans)):
+        kinds = ENTITY_SLOTS.get(slot)
+        if kinds is None or start < 0:
+            continue
+        # the group may start with spaces the pattern let through
+        start += len(clean_input[start:end]) - len(clean_input[start:end].lstrip())
+        entity = entities.match_at(clean_input, start, kinds + ("date",))
+        if entity is None:
+            continue
+        if entity.kind == "date" and "date" not in kinds and DATE_RULE in rules.index:
+            return rules.index[DATE_RULE], ((entity.start, entity.end),)
+        if entity.kind in kinds:
+            spans[position] = (start, max(end, entity.end))
+    return index, tuple(spans)
+
+def place_only_hit(clean_input, session, rules):
+    """
+    (rule_index, spans) for an input that is exactly one known place, or
+    None. At a stage that maps PLACE_RULE to another rule, answers as that.
+    """
+    if PLACE_RULE not in rules.index:
+        return None
+    start = len(clean_input) - len(clean_input.lstrip())
+    entity = gazetteer.default_gazetteer().match_at(clean_input, start, ENTITY_SLOTS["city"])
+    if entity is None or clean_input[entity.end:].strip():
+        return None
+    answer = PLACE_RULE
+    if session is not None:
+        answer = next((a for m, a in rules.stage_rules.get(session.stage, ()) if m == PLACE_RULE), PLACE_RULE)
+    return rules.index[answer], ((entity.start, entity.end),)
+
+# cache entry for inputs that fall through to DEFAULT_RESPONSES
+_NO_MATCH = (-1, (), (), None)
+
+def _analyse(clean_input, session, rules):
+    """
+    Runs the rule scan and reflection for one cleaned input.
+    Returns (rule_index or -1, spans, reflected groups, clean_input).
+    """
+    hit = match_rule(clean_input, session, rules)
+    if not hit and USE_GAZETTEER:
+        hit = place_only_hit(clean_input, session, rules)
+    if not hit:
+        return _NO_MATCH
+    index, spans = hit
+    if USE_GAZETTEER:
+        index, spans = resolve_entities(clean_input, index, spans, rules)
+    # apply word reflection and stripping to the captured groups
+    reflected_groups = tuple(rules.reflector.many([clean_input[start:end] for start, end in spans if start >= 0]))
+    return index, spans, reflected_groups, clean_input
+
+# =======================================================================
+# INPUT LENGTH GUARD
+# =======================================================================
+# Several rules stack greedy and lazy wildcards (`.*\b(...)\b(?:.*?)...`),
+# which backtrack quadratically (flight_route: cubically) on long inputs:
+# at 500 characters the worst rule takes ~5 ms, at 4000 over 2 s. A 50 KB
+# pasted itinerary could stall a worker. Anything longer than
+# MAX_INPUT_CHARS is either cut down to that length ("truncate") or not
+# matched at all and answered with a fallback ("reject").
+# bench_chatbot.py redos measures how each rule scales with length.
+# =======================================================================
+
+MAX_INPUT_CHARS = int(os.environ.get("TRAVEL_MAX_INPUT_CHARS", "500"))
+LONG_INPUT_MODE = os.environ.get("TRAVEL_LONG_INPUT_MODE", "truncate")
+
+# =======================================================================
+# BOOKINGS
+# =======================================================================
+# With a booking ledger enabled (bookings.py), the room and ticket
+# confirmation rules really book: the total is worked out from the
+# session's slots and PRICES, hotel rooms come out of the inventory, and
+# the booking is queued for the SQLite writer thread (respond() never
+# waits on the disk). A hotel without enough rooms left gets
+# SOLD_OUT_RESPONSES instead of a confirmation, and the funnel stays on
+# the room count. A session that skipped a step the price depends on (no
+# hotel or class picked, or a count that isn't a number) is asked for it
+# with MISSING_SLOT_RESPONSES instead, and its stage is left where it was.
+# Once a booking is queued, the slots it used up (the hotel or class, and
+# the count) are cleared, so a later "2 rooms" doesn't book them again.
+#
+# If the writer thread then fails to commit it, the ledger gives the rooms
+# back, and the session's next message is answered with
+# BOOKING_FAILED_RESPONSES: the slots are put back and the funnel returns
+# to the count question, so the user can simply answer it again.
+#
+# Turn it on with enable_bookings("bookings.db") or TRAVEL_BOOKINGS_DB.
+# =======================================================================
+
+# confirmation rules, and what they book
+BOOKING_RULES = {
+    "rooms_exact": "hotel",
+    "rooms_any": "hotel",
+    "tickets_exact": "flight",
+    "tickets_any": "flight",
+}
+
+SOLD_OUT_RESPONSES = [
+    "Sorry, {0} only has {1} room(s) left. How many rooms would you like?",
+    "I'm afraid {0} can't take that many guests, there are {1} room(s) left. How many should I book?",
+]
+
+# what to ask for when a confirmation can't be priced, by missing slot
+# ({0} is "rooms" or "tickets")
+MISSING_SLOT_RESPONSES = {
+    "hotel": [
+        "Which hotel should I book the rooms at? Hotels 1-3 are luxury, Hotels 4-6 are budget.",
+        "Before I book any rooms, which hotel would you like, Hotel 1 to Hotel 6?",
+    ],
+    "travel_class": [
+        "Which class should I book the tickets in, economy or business?",
+        "Before I book any tickets, would you like economy or business class?",
+    ],
+    "count": [
+        "How many {0} would you like? A number is fine, like 2.",
+        "Sorry, I didn't catch how many {0}. How many should I book?",
+    ],
+}
+
+# slots a queued booking uses up
+BOOKED_SLOTS = {
+    "hotel": ("hotel", "count"),
+    "flight": ("travel_class", "count"),
+}
+
+BOOKING_FAILED_RESPONSES = [
+    "Sorry, I couldn't save your booking of {0}, so nothing has been booked yet. How many {1} would you like?",
+    "Something went wrong while saving your booking of {0} and it didn't go through. How many {1} should I book?",
+]
+
+def booking_failed(booking, session, selector, clean_input):
+    """
+    Puts the slots of a booking that failed to commit back into the
+    session, moves it to the count question and returns the reply.
+    """
+    if booking.kind == "hotel":
+        session.hotel = booking.item
+        session.stage = "hotel_rooms"
+        return selector.pick(BOOKING_FAILED_RESPONSES, clean_input).format(
+            f"{booking.quantity} room(s) at {booking.item}", "rooms")
+    session.travel_class = booking.item
+    session.stage = "flight_tickets"
+    return selector.pick(BOOKING_FAILED_RESPONSES, clean_input).format(
+        f"{booking.quantity} {booking.item} ticket(s)", "tickets")
+
+BOOKINGS = None
+
+def enable_bookings(path="bookings.db", **options):
+    """
+    Starts a BookingLedger on the given SQLite file and returns it.
+    """
+    global BOOKINGS
+    disable_bookings()
+    BOOKINGS = bookings.BookingLedger(path, **options)
+    return BOOKINGS
+
+def disable_bookings():
+    """
+    Writes out anything still queued and stops recording bookings.
+    """
+    global BOOKINGS
+    if BOOKINGS is not None:
+        BOOKINGS.close()
+        BOOKINGS = None
+
+if os.environ.get("TRAVEL_BOOKINGS_DB"):
+    enable_bookings(os.environ["TRAVEL_BOOKINGS_DB"])
+
+def respond(user_input, session=None, selector=None):
+    """
+    Takes the user input, matches it against predefined regex patterns
+    (through the active RuleSet's compiled dispatcher), extracts info using capture groups, reflects pronouns, and formats 
     the selected response.
+    If a Session is given, the rules for its funnel stage are tried first
+    and the captured values are stored in its slots.
+    The reply is picked by `selector`, else the session's selector, else
+    DEFAULT_SELECTOR.
     """
+    if selector is None:
+        selector = session.selector if session is not None and session.selector is not None else DEFAULT_SELECTOR
+
+    # read once, so a hot reload can't swap rules halfway through a reply
+    rules = ACTIVE_RULES
+
+    clean_input = user_input.strip()
+
+    # a booking this session made earlier didn't reach the disk
+    ledger = BOOKINGS
+    if ledger is not None and session is not None:
+        failed = ledger.pop_failed(session.session_id)
+        if failed is not None:
+            return booking_failed(failed, session, selector, clean_input)
+
+    # Keep one huge message from stalling the regex engine
+    if MAX_INPUT_CHARS and len(clean_input) > MAX_INPUT_CHARS:
+        if LONG_INPUT_MODE == "reject":
+            if METRICS is not None:
+                METRICS.record_response(True)
+            return selector.pick(rules.default_templates, clean_input[:MAX_INPUT_CHARS]).text
+        clean_input = clean_input[:MAX_INPUT_CHARS].rstrip()
+
     # Clean up input slightly to remove trailing punctuation that might mess up capture groups
-    clean_input = re.sub(r'[?!.]+$', '', user_input.strip())
-
-    # Iterate through our compiled regex patterns
-    for pattern, responses in RULES.items():
-        match = pattern.match(clean_input)
-        
-        # If the input matches a regex pattern
-        if match:
-            # Pick a random response from the mapped list
-            chosen_response = random.choice(responses)
-            
-            # Extract the captured groups (e.g., Target destinations or origins)
-            groups = match.groups()
-            
-            # If there are groups to reflect and substitute
-            if groups:
-                # Apply word reflection and stripping
-                reflected_groups = [reflect(g.strip()) for g in groups if g is not None]
-                
-                try:
-                    # Substitute the groups into the response template using positional formatting
-                    return chosen_response.format(*reflected_groups)
-                except IndexError:
-                    # Fallback if there's a mismatch between format tokens and captured groups
-                    return chosen_response
-            else:
-                return chosen_response
+    # (same as re.sub(r'[?!.]+$', '', ...) on the stripped text, without the regex)
+    clean_input = clean_input.rstrip("?!.")
+
+    # Find the first rule that matches (cached, or in a single pass over the input)
+    cache = RESPONSE_CACHE
+    if cache is not None:
+        normalized = clean_input.lower()
+        # lower() can change the length of some non-ASCII text, and then
+        # the cached spans wouldn't line up with this input
+        if len(normalized) == len(clean_input):
+            key = (rules.version, session.stage if session is not None else None, normalized)
+            analysis = cache.get(key)
+            if analysis is None:
+                analysis = _analyse(clean_input, session, rules)
+                cache.put(key, analysis)
+        else:
+            analysis = _analyse(clean_input, session, rules)
+    else:
+        analysis = _analyse(clean_input, session, rules)
+    index, spans, reflected_groups, analysed_input = analysis
+
+    # reflection keeps the user's casing, so a cache hit from a message that
+    # only differed in case ("PARIS" vs "Paris") reflects its own groups
+    if analysed_input != clean_input and spans:
+        reflected_groups = rules.reflector.many([clean_input[start:end] for start, end in spans if start >= 0])
+
+    if METRICS is not None:
+        METRICS.record_response(index < 0)
+
+    # If no pattern matched, return a fallback response
+    if index < 0:
+        return selector.pick(rules.default_templates, clean_input).text
+
+    # Remember what the user told us and move the funnel along
+    if session is not None:
+        name = rules.names[index]
+        values = [clean_input[start:end].strip() if start >= 0 else None for start, end in spans]
 
-    # If no pattern matched, return a random fallback response
-    return random.choice(DEFAULT_RESPONSES)
+        booking = None
+        if ledger is not None and name in BOOKING_RULES and values:
+            booking, rooms_left = ledger.confirm(BOOKING_RULES[name], session, values[0])
+            if rooms_left is not None:
+                hotel = bookings.parse_hotel(session.hotel)
+                return selector.pick(SOLD_OUT_RESPONSES, clean_input).format(hotel, rooms_left)
+            if booking is None:
+                # nothing to price it with yet: ask, and don't move the funnel
+                kind = BOOKING_RULES[name]
+                missing = bookings.missing_slot(kind, session, values[0])
+                return selector.pick(MISSING_SLOT_RESPONSES[missing], clean_input).format(
+                    "rooms" if kind == "hotel" else "tickets")
 
-def main():
+        session.update(rules.slots.get(name, ()), rules.next_stage.get(name), values)
+        if booking is not None:
+            for slot in BOOKED_SLOTS[booking.kind]:
+                setattr(session, slot, None)
+
+    # Pick one of the mapped responses
+    chosen_response = selector.pick(rules.templates[index], clean_input)
+
+    # If there are groups to reflect and substitute
+    if spans:
+        # Substitute the reflected groups into the pre-parsed template (falls
+        # back to the raw template if it asks for more groups than we captured)
+        return chosen_response.render(reflected_groups)
+    return chosen_response.text
+
+GREETING = "Hello! I am your Travel Booking Assistant. Do you want to book a flight or a hotel today?"
+
+def main(store=None, session_id=None):
     """
     The main chat loop that interacting with the user via standard input/output.
+    With a session store, the conversation is loaded from it and saved
+    after every reply, so it can be picked up again (by this or any other
+    process) with the same session id.
     """
     print("=" * 60)
     print("✈️🏨   Travel Booking Assistant Initialized   🏨✈️")
@@ -242,7 +1531,16 @@ def main():
     print("Type 'quit', 'exit', or 'bye' to end the conversation.")
     print("-" * 60)
     
-    print("\nBot: Hello! I am your Travel Booking Assistant. Do you want to book a flight or a hotel today?")
+    # Keep track of where we are in the booking funnel
+    session = Session(session_id)
+    history = None
+    if store is not None:
+        history = store.load(session_id, session)
+    if history:
+        print(f"\nBot: Welcome back! {history[-1][1]}")
+    else:
+        history = [("assistant", GREETING)]
+        print(f"\nBot: {GREETING}")
     
     while True:
         try:
@@ -259,8 +1557,14 @@ def main():
                 continue
                 
             # Get the bot's response and print it
-            reply = respond(user_input)
+            reply = respond(user_input, session)
             print(f"Bot: {reply}")
+
+            if store is not None:
+                history.append(("user", user_input))
+                history.append(("assistant", reply))
+                del history[:-store.history_limit]
+                store.save(session_id, session, history)
             
         except KeyboardInterrupt:
             # Handle CTRL+C gracefully
@@ -271,5 +1575,181 @@ def main():
             print("\nBot: Goodbye!")
             break
 
+# =======================================================================
+# BATCH / OFFLINE TRANSCRIPT REPLAY
+# =======================================================================
+# Replays logged conversations through respond() to regression-test and
+# analyse traffic:
+#   python travel_chatbot.py --replay transcripts.jsonl --out replies.jsonl
+# Input lines look like {"session": "abc", "message": "hi"}. Output lines
+# are {"session", "turn", "message", "reply"}, written as soon as a work
+# unit finishes, so neither file is ever held in memory.
+#
+# Work units are runs of consecutive lines grouped into chunks and sent
+# to a process pool. Different sessions run in parallel, but a session
+# is never in two units at once: if it shows up again while an earlier
+# unit still has it, we wait for that unit and hand its Session state on.
+#
+# Between units the parent keeps every session's state, up to
+# max_sessions of them in memory. Past that the one that has gone longest
+# without a message is parked in a temporary SQLite file
+# (session_store.SpillFile) and read back if it shows up again, so the
+# replies and turn numbers never depend on the cap, the chunk size or the
+# number of workers.
+# =======================================================================
+
+def _replay_unit(unit, seed, rules_path=None):
+    """
+    Worker side: answers every message of a work unit, in order per session.
+    `unit` is a list of (session_id, session, first_turn, messages).
+    """
+    if rules_path and ACTIVE_RULES.source != rules_path:
+        install_rules(load_rules(rules_path))
+
+    results = []
+    for session_id, session, turn, messages in unit:
+        records = []
+        for message in messages:
+            # salting with (seed, session, turn) keeps replies identical no
+            # matter which worker or in which order the unit runs
+            reply = respond(message, session, HashSelector(f"{seed}:{session_id}:{turn}:"))
+            records.append({"session": session_id, "turn": turn, "message": message, "reply": reply})
+            turn += 1
+        results.append((session_id, session, turn, records))
+    return results
+
+def _read_replay_units(lines, chunk_size):
+    """
+    Streams the input and yields work units of about chunk_size messages,
+    as {session_id: [messages in order]} dicts.
+    """
+    unit = {}
+    size = 0
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            session_id = str(record["session"])
+            message = record["message"]
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"line {line_number}: expected {{\"session\": ..., \"message\": ...}}")
+
+        unit.setdefault(session_id, []).append(message)
+        size += 1
+        if size >= chunk_size:
+            yield unit
+            unit = {}
+            size = 0
+    if unit:
+        yield unit
+
+def replay(in_path, out_path, workers=None, chunk_size=500, seed=0, rules_path=None, max_sessions=100_000):
+    """
+    Replays a JSONL transcript file through respond() on a process pool and
+    writes one JSONL reply record per message. Returns the number of replies.
+    """
+    sessions = OrderedDict()   # session id -> (Session, next turn number), least recent first
+    spill = None               # where sessions past max_sessions wait, made on the first one
+    busy = {}       # session id -> future of the unit that has it right now
+    pending = {}    # future -> session ids in that unit
+    written = 0
+    workers = workers or os.cpu_count() or 1
+
+    with open(in_path, "r", encoding="utf-8") as src, \
+            open(out_path, "w", encoding="utf-8") as out, \
+            ProcessPoolExecutor(workers) as pool:
+        max_pending = 2 * workers
+
+        def collect(futures):
+            nonlocal written, spill
+            for future in futures:
+                for session_id in pending.pop(future):
+                    if busy.get(session_id) is future:
+                        del busy[session_id]
+                for session_id, session, turn, records in future.result():
+                    sessions[session_id] = (session, turn)
+                    if len(sessions) > max_sessions:
+                        if spill is None:
+                            spill = session_store.SpillFile()
+                        idle_id, (idle_session, idle_turn) = sessions.popitem(last=False)
+                        spill.put(idle_id, idle_session, idle_turn)
+                    for record in records:
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    written += len(records)
+
+        try:
+            for unit in _read_replay_units(src, chunk_size):
+                # a session still in flight has to come back before it can move on
+                blocking = {busy[session_id] for session_id in unit if session_id in busy}
+                if blocking:
+                    wait(blocking)
+                    collect([future for future in blocking if future in pending])
+
+                # keep a bounded number of units in flight
+                while len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+                work = []
+                for session_id, messages in unit.items():
+                    session, turn = sessions.pop(session_id, (None, 0))
+                    if session is None:
+                        session = Session(session_id)
+                        if spill is not None:
+                            turn = spill.take(session_id, session) or 0
+                    work.append((session_id, session, turn, messages))
+
+                future = pool.submit(_replay_unit, work, seed, rules_path)
+                pending[future] = list(unit)
+                for session_id in unit:
+                    busy[session_id] = future
+
+            collect(list(pending))
+        finally:
+            if spill is not None:
+                spill.close()
+
+    return written
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="ELIZA-style travel booking chatbot")
+    parser.add_argument("--replay", metavar="TRANSCRIPTS", help="replay a JSONL transcript file instead of chatting")
+    parser.add_argument("--out", metavar="REPLIES", help="where to write the replies (JSONL), required with --replay")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="messages per work unit")
+    parser.add_argument("--seed", type=int, default=0, help="seed for reproducible replies")
+    parser.add_argument("--max-sessions", type=int, default=100_000,
+                        help="conversations the replay keeps in memory between work units (the rest wait on disk)")
+    parser.add_argument("--rules", metavar="FILE", help="JSON/YAML rule file to use instead of the built-in rules")
+    parser.add_argument("--export-rules", metavar="FILE", help="write the built-in rules out as a JSON rule file and exit")
+    parser.add_argument("--sessions", metavar="DB", default=os.environ.get("TRAVEL_SESSION_DB"),
+                        help="SQLite session store shared with other workers (default: $TRAVEL_SESSION_DB)")
+    parser.add_argument("--session-id", default="cli", help="conversation to resume from --sessions")
+    args = parser.parse_args()
+
+    if args.export_rules:
+        save_rules(builtin_rules(), args.export_rules)
+        print(f"Wrote {len(RULES)} rules to {args.export_rules}")
+        raise SystemExit(0)
+
+    if args.rules:
+        try:
+            install_rules(load_rules(args.rules))
+        except RuleFileError as error:
+            parser.error(str(error))
+
+    if args.replay:
+        if not args.out:
+            parser.error("--out is required with --replay")
+        count = replay(args.replay, args.out, args.workers, args.chunk_size, args.seed, args.rules,
+                       args.max_sessions)
+        print(f"Replayed {count} messages into {args.out}")
+    elif args.sessions:
+        store = session_store.open_store(args.sessions)
+        try:
+            main(store, args.session_id)
+        finally:
+            store.close()
+    else:
+        main()
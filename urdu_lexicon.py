@@ -0,0 +1,498 @@
+import os
+import sys
+import json
+import math
+import mmap
+import time
+import struct
+import argparse
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import urdu_segmentation
+from urdu_segmentation import fold_urdu_text, punctuation_marks
+
+# ===================================================================== #
+# URDU BOUNDARY LEXICON
+# ===================================================================== #
+# end_words and continuation_words in urdu_segmentation.py are picked by
+# hand (and 'کیا' is in both). This learns the same thing from a gold
+# corpus instead, in the one-sentence-per-line format --evaluate reads:
+#
+#   python urdu_lexicon.py train gold/ --out urdu.ulex
+#   python urdu_lexicon.py evaluate urdu.ulex test_gold.txt
+#
+# For every word it counts how often it ends a sentence and how often it
+# starts one, and for every pair of neighbouring words how often a
+# sentence boundary falls between them. The counts go into one binary
+# file (vocabulary + arrays) that is memory-mapped when loaded, and
+# LexiconRules uses them in place of the word lists: a couple of dict and
+# array lookups per word, whatever the size of the table.
+
+# ===================================================================== #
+# STEP 1: COUNTING
+# ===================================================================== #
+
+# bytes of a gold file handed to one worker at a time
+SHARD_SIZE = 16 << 20
+
+
+# splits one gold file into (path, start, end) byte ranges of about
+# shard_size. Unlike urdu_segmentation.plan_shards() these end on a
+# newline, since a line is a sentence
+def plan_line_shards(file_path, shard_size=SHARD_SIZE):
+    size = os.path.getsize(file_path)
+    shards = []
+    start = 0
+    with open(file_path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + shard_size, size))
+            f.readline()
+            end = f.tell()
+            shards.append((file_path, start, end))
+            start = end
+    return shards
+
+
+# worker side: the counts for one shard. Pairs are kept as "word next"
+# strings (a word never holds a space), and pairs whose first word ends in
+# punctuation are skipped, since Rule 1 decides those without the table.
+# The shard's first and last word come back too, so the parent can add the
+# pair that straddles two shards
+def count_shard(shard, normalize=False):
+    file_path, start, end = shard
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    if normalize:
+        text = fold_urdu_text(text)
+    punctuation = tuple(punctuation_marks)
+
+    words_seen = Counter()
+    final = Counter()
+    initial = Counter()
+    pairs = Counter()
+    boundaries = Counter()
+    sentences = 0
+    first = previous = None
+    for line in text.split('\n'):
+        words = line.split()
+        if not words:
+            continue
+        sentences += 1
+        words_seen.update(words)
+        initial[words[0]] += 1
+        final[words[-1]] += 1
+        pairs.update(f"{word} {next_word}" for word, next_word in zip(words, words[1:])
+                     if not word.endswith(punctuation))
+
+        if previous is None:
+            first = words[0]
+        elif not previous.endswith(punctuation):
+            pair = f"{previous} {words[0]}"
+            pairs[pair] += 1
+            boundaries[pair] += 1
+        previous = words[-1]
+
+    return sentences, words_seen, final, initial, pairs, boundaries, first, previous
+
+
+# totals over a whole gold corpus (a file, a directory or a glob), counted
+# on a process pool. Each file is its own text: no pair runs across files
+def count_corpus(source, workers=None, shard_size=SHARD_SIZE, normalize=False):
+    totals = [0, Counter(), Counter(), Counter(), Counter(), Counter()]
+    punctuation = tuple(punctuation_marks)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for file_path in urdu_segmentation.corpus_files(source):
+            shards = plan_line_shards(file_path, shard_size)
+            previous = None
+            for result in pool.map(count_shard, shards, [normalize] * len(shards)):
+                sentences, first, last = result[0], result[6], result[7]
+                if sentences == 0:
+                    continue
+                totals[0] += sentences
+                for total, counts in zip(totals[1:], result[1:6]):
+                    total.update(counts)
+
+                if previous is not None and not previous.endswith(punctuation):
+                    pair = f"{previous} {first}"
+                    totals[4][pair] += 1
+                    totals[5][pair] += 1
+                previous = last
+    return totals
+
+
+# ===================================================================== #
+# STEP 2: THE TABLE
+# ===================================================================== #
+# File layout (native byte order, every array 8-byte aligned):
+#
+#   header       magic, version, byte order, sizes, pairs stored,
+#                corpus totals
+#   pair_keys    uint64 x slots   open-addressing hash table of word pairs:
+#                                 (first id + 1) << 32 | (second id + 1),
+#                                 0 for an empty slot
+#   word_count   uint32 x words   times the word was seen
+#   final        uint32 x words   times it ended a sentence
+#   initial      uint32 x words   times it started one
+#   pair_total   uint32 x slots   times the pair was seen
+#   pair_breaks  uint32 x slots   times a sentence ended between the two
+#   vocabulary   utf-8 words joined by '\n', in id order
+#
+# Loading maps the file and casts memoryviews over the arrays, so nothing
+# but the vocabulary dict is copied into the process. The header is
+# checked against the file first: a table that isn't a power of two, is
+# more than half full, or runs past the end of the file is refused.
+
+MAGIC = b'ULEX'
+VERSION = 2
+HEADER = struct.Struct('<4sIcxxxIIIxxxxQQQ')
+HEADER_SIZE = 64
+
+# multiplier for the pair hash (2^64 / golden ratio)
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+MASK_64 = (1 << 64) - 1
+
+
+class LexiconError(ValueError):
+    pass
+
+
+class Lexicon:
+
+    def __init__(self, words, word_count, final, initial, pair_keys, pair_total, pair_breaks,
+                 sentences, total_words, path=None):
+        self.words = words
+        # word -> id, the only structure built at load time
+        self.vocab = {word: index for index, word in enumerate(words)}
+        self.word_count = word_count
+        self.final = final
+        self.initial = initial
+        self.pair_keys = pair_keys
+        self.pair_total = pair_total
+        self.pair_breaks = pair_breaks
+        self.sentences = sentences
+        self.total_words = total_words
+        self.path = path
+        self.hash_shift = 64 - (len(pair_keys).bit_length() - 1)
+        self.hash_mask = len(pair_keys) - 1
+
+    def __len__(self):
+        return len(self.words)
+
+    def __repr__(self):
+        pairs = sum(1 for key in self.pair_keys if key)
+        return f"Lexicon({len(self.words)} words, {pairs} pairs, {self.sentences} sentences)"
+
+    # a mapped lexicon is sent to pool workers as its path, not its arrays
+    def __reduce__(self):
+        if self.path is not None:
+            return load_lexicon, (self.path,)
+        return Lexicon, (self.words, self.word_count, self.final, self.initial, self.pair_keys,
+                         self.pair_total, self.pair_breaks, self.sentences, self.total_words)
+
+    # slot of a (first id, second id) pair in the hash table, or -1. The
+    # probe gives up after going round the table once, so even a table
+    # with no empty slot left can't make it spin forever
+    def pair_slot(self, first, second):
+        key = (first + 1) << 32 | (second + 1)
+        keys = self.pair_keys
+        mask = self.hash_mask
+        slot = ((key * HASH_MULTIPLIER) & MASK_64) >> self.hash_shift
+        found = keys[slot]
+        if found == key:
+            return slot
+        if found == 0:
+            return -1
+        # most lookups end on the first slot; only collisions pay for the loop
+        for _ in range(mask):
+            slot = (slot + 1) & mask
+            found = keys[slot]
+            if found == key:
+                return slot
+            if found == 0:
+                return -1
+        return -1
+
+    # builds a lexicon from count_corpus() totals. Words seen fewer than
+    # min_count times and pairs seen fewer than min_pair_count times are
+    # left out; an unknown word or pair just falls back on what's known
+    @classmethod
+    def from_counts(cls, totals, min_count=2, min_pair_count=2):
+        sentences, words_seen, final, initial, pairs, boundaries = totals
+        words = sorted(word for word, count in words_seen.items() if count >= min_count)
+        vocab = {word: index for index, word in enumerate(words)}
+
+        kept = []
+        for pair, count in pairs.items():
+            if count < min_pair_count:
+                continue
+            first, second = pair.split(' ')
+            if first in vocab and second in vocab:
+                kept.append((vocab[first], vocab[second], count, boundaries[pair]))
+
+        # a power of two at least twice the pairs, so probes stay short
+        slots = 8
+        while slots < 2 * len(kept):
+            slots *= 2
+        pair_keys = array('Q', bytes(8 * slots))
+        pair_total = array('I', bytes(4 * slots))
+        pair_breaks = array('I', bytes(4 * slots))
+        shift = 64 - (slots.bit_length() - 1)
+        for first, second, count, breaks in kept:
+            key = (first + 1) << 32 | (second + 1)
+            slot = ((key * HASH_MULTIPLIER) & MASK_64) >> shift
+            while pair_keys[slot]:
+                slot = (slot + 1) & (slots - 1)
+            pair_keys[slot] = key
+            pair_total[slot] = count
+            pair_breaks[slot] = breaks
+
+        return cls(
+            words,
+            array('I', (words_seen[word] for word in words)),
+            array('I', (final[word] for word in words)),
+            array('I', (initial[word] for word in words)),
+            pair_keys, pair_total, pair_breaks,
+            sentences, sum(words_seen.values()),
+        )
+
+    # writes the table in the layout above
+    def save(self, path):
+        vocabulary = '\n'.join(self.words).encode('utf-8')
+        pairs = sum(1 for key in self.pair_keys if key)
+        header = HEADER.pack(MAGIC, VERSION, sys.byteorder[0].encode(), len(self.words), len(self.pair_keys),
+                             pairs, self.sentences, self.total_words, len(vocabulary))
+        with open(path, 'wb') as f:
+            f.write(header.ljust(HEADER_SIZE, b'\0'))
+            for values in (self.pair_keys, self.word_count, self.final, self.initial,
+                           self.pair_total, self.pair_breaks):
+                data = bytes(values)
+                f.write(data)
+                f.write(bytes(-len(data) % 8))
+            f.write(vocabulary)
+
+
+# maps a table written by Lexicon.save()
+def load_lexicon(path):
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER_SIZE:
+            raise LexiconError(f"{path}: not a lexicon file")
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, byteorder, word_total, slots, pairs, sentences, total_words, vocabulary_size = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise LexiconError(f"{path}: not a version {VERSION} lexicon file")
+    if byteorder != sys.byteorder[0].encode():
+        raise LexiconError(f"{path}: written on a machine with the other byte order")
+    if slots < 8 or slots & (slots - 1):
+        raise LexiconError(f"{path}: pair table of {slots} slots, expected a power of two of at least 8")
+    if 2 * pairs > slots:
+        raise LexiconError(f"{path}: {pairs} pairs in {slots} slots, the table may be at most half full")
+
+    layout = (('Q', slots), ('I', word_total), ('I', word_total), ('I', word_total), ('I', slots), ('I', slots))
+    end = HEADER_SIZE
+    for code, length in layout:
+        length *= struct.calcsize(code)
+        end += length + (-length % 8)
+    if end + vocabulary_size > size:
+        raise LexiconError(f"{path}: header describes {end + vocabulary_size} bytes but the file has {size}")
+
+    view = memoryview(data)
+    offset = HEADER_SIZE
+    arrays = []
+    for code, length in layout:
+        size = struct.calcsize(code) * length
+        arrays.append(view[offset:offset + size].cast(code))
+        offset += size + (-size % 8)
+    words = bytes(view[offset:offset + vocabulary_size]).decode('utf-8').split('\n') if word_total else []
+    if len(words) != word_total:
+        raise LexiconError(f"{path}: header says {word_total} words, the vocabulary has {len(words)}")
+
+    pair_keys, word_count, final, initial, pair_total, pair_breaks = arrays
+    return Lexicon(words, word_count, final, initial, pair_keys, pair_total, pair_breaks,
+                   sentences, total_words, path=path)
+
+
+# ===================================================================== #
+# STEP 3: SCORING BOUNDARIES
+# ===================================================================== #
+# A drop-in for urdu_segmentation.BoundaryRules. Rule 1 (punctuation) and
+# the "at least 2 words" part of Rule 2 stay as they are; the word lists
+# are replaced by a probability that a sentence ends between a word and
+# the next one:
+#   - how often the word ends a sentence and how often the next word
+#     starts one, combined as log-odds against the corpus-wide rate
+#     (a naive Bayes guess, which is all there is for unseen pairs)
+#   - for a pair seen in the corpus, its own boundary rate, pulled towards
+#     that guess by PAIR_SMOOTHING pseudo-counts
+# Words seen rarely are pulled towards the corpus-wide rate the same way.
+# The per-word log-odds are worked out once at load, so scoring one word is
+# two dict lookups, a hash probe and a little arithmetic.
+
+WORD_SMOOTHING = 2.0
+PAIR_SMOOTHING = 2.0
+
+
+def logit(p):
+    p = min(max(p, 1e-6), 1 - 1e-6)
+    return math.log(p / (1 - p))
+
+
+class LexiconRules:
+
+    def __init__(self, lexicon, threshold=0.5, punctuation=None):
+        self.lexicon = lexicon
+        self.threshold = threshold
+        self.punctuation = tuple(punctuation_marks if punctuation is None else punctuation)
+
+        prior = lexicon.sentences / lexicon.total_words if lexicon.total_words else 0.0
+        self.prior_logit = logit(prior)
+
+        # how far each word moves the log-odds, as the word before / after
+        def shifts(counts):
+            return array('d', (
+                logit((hits + WORD_SMOOTHING * prior) / (seen + WORD_SMOOTHING)) - self.prior_logit
+                for hits, seen in zip(counts, lexicon.word_count)))
+        self.end_shift = shifts(lexicon.final)
+        self.start_shift = shifts(lexicon.initial)
+
+    def __reduce__(self):
+        return LexiconRules, (self.lexicon, self.threshold, self.punctuation)
+
+    # probability that a sentence ends between word and next_word
+    def score(self, word, next_word):
+        lexicon = self.lexicon
+        first = lexicon.vocab.get(word)
+        second = lexicon.vocab.get(next_word)
+        guess = self.prior_logit
+        if first is not None:
+            guess += self.end_shift[first]
+        if second is not None:
+            guess += self.start_shift[second]
+        p = 1 / (1 + math.exp(-guess))
+
+        if first is not None and second is not None:
+            slot = lexicon.pair_slot(first, second)
+            if slot >= 0:
+                p = (lexicon.pair_breaks[slot] + PAIR_SMOOTHING * p) / (lexicon.pair_total[slot] + PAIR_SMOOTHING)
+        return p
+
+    # same contract as BoundaryRules.is_boundary()
+    def is_boundary(self, word, next_word, length):
+        if word.endswith(self.punctuation):
+            return True
+        if next_word is None:
+            # the end of the text closes the sentence either way
+            return True
+        return length >= 2 and self.score(word, next_word) >= self.threshold
+
+    # is_boundary() spelled out; the last word needs no check, whatever is
+    # left over is the last sentence anyway
+    def segment(self, cleaned_text):
+        words = cleaned_text.split()
+        punctuation = self.punctuation
+        score = self.score
+        threshold = self.threshold
+        sentences = []
+        start = 0
+        for i in range(len(words) - 1):
+            word = words[i]
+            if word.endswith(punctuation) or (i > start and score(word, words[i + 1]) >= threshold):
+                sentences.append(' '.join(words[start:i + 1]))
+                start = i + 1
+        if start < len(words):
+            sentences.append(' '.join(words[start:]))
+        return sentences
+
+    # BoundaryRules has a regex version of segment(); there's no word list
+    # to build one from here
+    segment_regex = segment
+
+
+# a lexicon file straight to rules
+def load_rules(path, threshold=0.5):
+    return LexiconRules(load_lexicon(path), threshold)
+
+
+# ===================================================================== #
+# STEP 4: HOW IT COMPARES
+# ===================================================================== #
+# Segments the text of each gold file (its lines joined up, which is what
+# preprocess_urdu_text() makes of the file) with the hand-written lists
+# and with the lexicon, and scores both the way eval_function() does
+def compare(rules, gold_source, normalize=False, verbose=True):
+    gold = []
+    for file_path in urdu_segmentation.corpus_files(gold_source):
+        gold.append(list(urdu_segmentation.iter_line_sentences(file_path, normalize)))
+    words = sum(len(sentence.split()) for sentences in gold for sentence in sentences)
+
+    results = {}
+    for label, candidate in (("word lists", urdu_segmentation.DEFAULT_RULES), ("lexicon", rules)):
+        predicted = []
+        start = time.perf_counter()
+        for sentences in gold:
+            predicted.extend(urdu_segmentation.segment_sentences(' '.join(sentences), candidate))
+        elapsed = time.perf_counter() - start
+        metrics = urdu_segmentation.eval_function(
+            [sentence for sentences in gold for sentence in sentences], predicted, verbose=False)
+        results[label] = (metrics, words / elapsed if elapsed else 0.0)
+
+    if verbose:
+        print(f"{'':<12}{'precision':>10}{'recall':>10}{'F1':>10}{'words/s':>14}")
+        for label, (metrics, speed) in results.items():
+            print(f"{label:<12}{metrics.precision:>10.4f}{metrics.recall:>10.4f}{metrics.f1_score:>10.4f}{speed:>14,.0f}")
+        (old, old_speed), (new, new_speed) = results.values()
+        print(f"{'change':<12}{new.precision - old.precision:>+10.4f}{new.recall - old.recall:>+10.4f}"
+              f"{new.f1_score - old.f1_score:>+10.4f}{new_speed / old_speed if old_speed else 0:>13.2f}x")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Learn Urdu sentence boundaries from a gold corpus")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train = commands.add_parser("train", help="count a gold corpus (one sentence per line) into a lexicon file")
+    train.add_argument("gold", help="gold file, directory or glob")
+    train.add_argument("--out", required=True, help="lexicon file to write")
+    train.add_argument("--workers", type=int, help="counting processes (default: all cores)")
+    train.add_argument("--shard-size", type=int, default=SHARD_SIZE >> 20, help="MB of a file counted at a time")
+    train.add_argument("--min-count", type=int, default=2, help="leave out words seen fewer times")
+    train.add_argument("--min-pair-count", type=int, default=2, help="leave out word pairs seen fewer times")
+    train.add_argument("--normalize", action="store_true", help="normalize the text first (see urdu_segmentation)")
+
+    evaluate = commands.add_parser("evaluate", help="score the lexicon against the word lists on a gold corpus")
+    evaluate.add_argument("lexicon", help="lexicon file written by train")
+    evaluate.add_argument("gold", help="gold file, directory or glob (best kept apart from the training corpus)")
+    evaluate.add_argument("--threshold", type=float, default=0.5, help="boundary probability needed to split")
+    evaluate.add_argument("--normalize", action="store_true", help="normalize the text first")
+    evaluate.add_argument("--json", help="also write both sets of metrics to this JSON file")
+    args = parser.parse_args()
+
+    if not urdu_segmentation.corpus_files(args.gold):
+        parser.error(f"no files found for {args.gold!r}")
+
+    if args.command == "train":
+        start = time.perf_counter()
+        totals = count_corpus(args.gold, args.workers, args.shard_size << 20, args.normalize)
+        lexicon = Lexicon.from_counts(totals, args.min_count, args.min_pair_count)
+        lexicon.save(args.out)
+        elapsed = time.perf_counter() - start
+        megabytes = urdu_segmentation.corpus_bytes(args.gold) / 1e6
+        print(f"{lexicon!r} from {megabytes:.1f} MB in {elapsed:.2f}s "
+              f"-> {args.out} ({os.path.getsize(args.out) / 1e3:.1f} kB)")
+    else:
+        try:
+            rules = load_rules(args.lexicon, args.threshold)
+        except (OSError, LexiconError) as error:
+            parser.error(str(error))
+        results = compare(rules, args.gold, args.normalize)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({label: {**metrics.__dict__, "words_per_second": speed}
+                           for label, (metrics, speed) in results.items()}, f, indent=2)
+                f.write('\n')
@@ -1,6 +1,16 @@
 #Abdul Basit 102366
 import re
 import os
+import sys
+import glob
+import time
+import json
+import mmap
+import argparse
+import unicodedata
+from dataclasses import dataclass, asdict
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 
 # ===================================================================== #
 # STEP 1: READING THE FILE
@@ -41,6 +51,135 @@ def preprocess_urdu_text(text):
     return cleaned_text
 
 
+# Real corpora mix Arabic and Urdu code points for the same letter (ي/ی,
+# ك/ک, ه/ہ), carry aerab, zero-width joiners and bidi marks, and sometimes
+# come out of PDFs as presentation forms. None of that matches end_words or
+# punctuation_marks, so e.g. 'هے' or 'ہے۔' + ZWNJ never ends a sentence.
+#
+# Nearly all of it is done per character, so it goes into one str.translate
+# table built once at import. Whitespace is then collapsed by split()/join(),
+# the same way iter_words() and iter_line_sentences() already do it.
+#
+# The one exception is the arabic ه: after a consonant that can be
+# aspirated it stands for do-chashmi he (تها is تھا, not تہا), anywhere
+# else for ہ. The table leaves it alone and fold_urdu_text() settles it
+# afterwards with one regex, so by then arabic kaf, presentation forms and
+# dropped marks between the two letters are already out of the way.
+
+# arabic code point -> the urdu one the word lists use
+URDU_FOLDING = {
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک',
+    'ۀ': 'ۂ', 'ة': 'ۃ',
+    # arabic-indic digits -> the extended ones used in urdu
+    **{chr(0x0660 + d): chr(0x06F0 + d) for d in range(10)},
+    # latin / fullwidth sentence punctuation -> what punctuation_marks has
+    '?': '؟', '？': '؟', '！': '!', '．': '.',
+}
+
+# characters dropped outright: aerab and quranic marks, tatweel, zero-width
+# (non-)joiners, bidi marks, BOM, soft hyphen. The madda and hamza marks
+# (U+0653-0655) stay, they are part of letters like آ and ۂ when decomposed
+URDU_IGNORED = (
+    list(range(0x0610, 0x061B)) + list(range(0x064B, 0x0653)) + list(range(0x0656, 0x0660))
+    + [0x0670, 0x0640] + list(range(0x06D6, 0x06DD)) + list(range(0x06DF, 0x06E5))
+    + [0x06E7, 0x06E8] + list(range(0x06EA, 0x06EE))
+    + [0x200B, 0x200C, 0x200D, 0x200E, 0x200F, 0x061C, 0xFEFF, 0x00AD]
+    + list(range(0x202A, 0x202F)) + list(range(0x2066, 0x206A))
+)
+
+
+# builds the translate table: folding, dropped characters, and arabic
+# presentation forms (U+FB50-FDFF, U+FE70-FEFF) turned back into the
+# letters they are drawn from, folded the same way.
+#
+# It comes back as a list covering the whole BMP rather than a dict: for a
+# character that isn't in a dict, str.translate raises and swallows a
+# KeyError, and in urdu text that's nearly every character. The list maps
+# those to themselves, which makes the pass about twice as fast (and costs
+# ~2 MB). Characters past U+FFFF fall off the end and are left as they are
+def build_normalization_table():
+    table = {ord(char): folded for char, folded in URDU_FOLDING.items()}
+    table.update(dict.fromkeys(URDU_IGNORED))
+
+    for code in list(range(0xFB50, 0xFE00)) + list(range(0xFE70, 0xFF00)):
+        decomposition = unicodedata.decomposition(chr(code)).split()
+        if not decomposition or not decomposition[0].startswith('<'):
+            continue
+        letters = ''.join(chr(int(part, 16)) for part in decomposition[1:])
+        table[code] = letters.translate(table)
+
+    flat = list(range(0x10000))
+    for code, replacement in table.items():
+        flat[code] = replacement
+    return flat
+
+
+NORMALIZATION_TABLE = build_normalization_table()
+
+# consonants that take do-chashmi he (ھ) when aspirated
+ASPIRATABLE = 'بپتٹجچدڈرڑکگلمن'
+# the ه comes first so the regex engine can jump from one ه to the next
+# instead of trying the lookbehind at every character (~4x faster)
+ASPIRATED_HEH = re.compile('ه(?<=[' + ASPIRATABLE + ']ه)')
+
+
+# the translate pass, then the arabic ه: ھ after an aspiratable
+# consonant, ہ everywhere else. Most text has no ه at all and skips both
+def fold_urdu_text(text):
+    text = text.translate(NORMALIZATION_TABLE)
+    if 'ه' in text:
+        text = ASPIRATED_HEH.sub('ھ', text).replace('ه', 'ہ')
+    return text
+
+
+# fold_urdu_text() for a stream read in chunks; the chunks it yields join
+# up to fold_urdu_text(stream.read()). A consonant at the very end of a
+# chunk is held back, the next chunk may start with its ه
+def iter_folded(stream, chunk_size):
+    carry = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        chunk = fold_urdu_text(carry + chunk)
+        if chunk and chunk[-1] in ASPIRATABLE:
+            carry = chunk[-1]
+            chunk = chunk[:-1]
+        else:
+            carry = ""
+        yield chunk
+    if carry:
+        yield carry
+
+
+# one pass of folding plus whitespace cleanup; gives the same spacing as
+# preprocess_urdu_text()
+def normalize_urdu_text(text):
+    return ' '.join(fold_urdu_text(text).split())
+
+
+# normalize_urdu_text() for a stream read in chunks. The pieces it yields
+# join up to exactly normalize_urdu_text(stream.read()), because a space
+# is only written out once the chunk after it shows more text is coming
+def iter_normalized(stream, chunk_size=None):
+    chunk_size = chunk_size or CHUNK_SIZE
+    started = False
+    pending_space = False
+    for chunk in iter_folded(stream, chunk_size):
+        words = chunk.split()
+        if not words:
+            # whitespace counts as one space; dropped characters as nothing
+            pending_space = pending_space or bool(chunk)
+            continue
+
+        piece = ' '.join(words)
+        if started and (pending_space or chunk[0].isspace()):
+            piece = ' ' + piece
+        yield piece
+        started = True
+        pending_space = chunk[-1].isspace()
+
+
 # ===================================================================== #
 # STEP 3: DEFINING THE "SPLIT" RULES
 # rules for deciding where to split
@@ -69,114 +208,716 @@ continuation_words = [
 # ===================================================================== #
 # STEP 4: THE LOOP (SEGMENTATION)
 # ===================================================================== #
-# goes through the text word by word and applies the rules
-def segment_sentences(cleaned_text):
-    # split text by space to get individual words
-    words = cleaned_text.split(' ') 
+# The rules are compiled once into a BoundaryRules object: the word lists
+# become frozensets (one hash lookup instead of scanning a list) and the
+# punctuation becomes a tuple, so a single word.endswith() call checks all
+# of it. Pass your own lists to try different rules; the module-level lists
+# above are the defaults.
+class BoundaryRules:
 
-    sentences = []
-    current_sentence = []
-    
-    # iterate using enumerate to keep track of the index
-    for i, word in enumerate(words):
-
-        current_sentence.append(word)
-        
-        # Rule 1: check if word ends with standard punctuation
-        ends_with_punctuation = any(word.endswith(punct) for punct in punctuation_marks)
+    def __init__(self, punctuation=None, end=None, continuation=None):
+        self.punctuation = tuple(punctuation_marks if punctuation is None else punctuation)
+        self.end_words = frozenset(end_words if end is None else end)
+        self.continuation_words = frozenset(continuation_words if continuation is None else continuation)
         
-        # Rule 2: check if word is an 'end word' AND the next word starts a new sentence
-        is_end_word = word in end_words
-        
-        # get the next word (if we're not at the very end of the text)
-        next_word = words[i + 1] if i + 1 < len(words) else None
+        # for segment_regex(): a word ending in punctuation, or an end word
+        # followed by a continuation word (or the end of the text).
+        # longest first so 'ہوں' isn't cut short by 'ہو'; an empty list
+        # becomes (?!) which never matches
+        def alternation(items):
+            return '|'.join(re.escape(item) for item in sorted(items, key=len, reverse=True)) or '(?!)'
+            
+        self.boundary_pattern = re.compile(
+            f"(?:{alternation(self.punctuation)})(?![^ ])"
+            f"|(?<![^ ])(?P<end>{alternation(self.end_words)})"
+            f"(?= (?:{alternation(self.continuation_words)})(?![^ ])|\\Z)"
+        )
+
+    # Rule 1 and Rule 2 for a single word. length is how many words the
+    # sentence has including this one, next_word is None at the very end
+    def is_boundary(self, word, next_word, length):
+        if word.endswith(self.punctuation):
+            return True
+        return (word in self.end_words
+                and (next_word in self.continuation_words or next_word is None)
+                and length >= 2)
+
+    # goes through the text word by word and applies the rules
+    def segment(self, cleaned_text):
+        # split text by space to get individual words
+        words = cleaned_text.split(' ')
         
-        # make sure sentence has at least 2 words to avoid splitting on a single word by accident
-        suggests_boundary = is_end_word and (next_word in continuation_words or next_word is None) and len(current_sentence) >= 2
+        punctuation = self.punctuation
+        end = self.end_words
+        continuation = self.continuation_words
+        last = len(words) - 1
         
-        # if any of the rules hit, save the sentence
-        if ends_with_punctuation or suggests_boundary:
-            # put the words back together into a string
-            full_sentence = ' '.join(current_sentence).strip()
-            
-            # append and reset for the next loop
-            if full_sentence: 
-                sentences.append(full_sentence)
+        sentences = []
+        start = 0
+        for i, word in enumerate(words):
+            # Rule 1: the word ends with punctuation
+            # Rule 2: an end word, the next word starts a new sentence, and
+            # the sentence has at least 2 words (i > start)
+            if word.endswith(punctuation) or (
+                    word in end and i > start
+                    and (i == last or words[i + 1] in continuation)):
+                full_sentence = ' '.join(words[start:i + 1]).strip()
+                if full_sentence:
+                    sentences.append(full_sentence)
+                start = i + 1
                 
-            current_sentence = []
-            
-    # if there are any words left over at the end of the loop, group them up
-    if current_sentence:
-        full_sentence = ' '.join(current_sentence).strip()
-
+        # whatever is left over at the end
+        full_sentence = ' '.join(words[start:]).strip()
         if full_sentence:
             sentences.append(full_sentence)
             
-    return sentences
+        return sentences
+
+    # same result as segment() for cleaned text (single spaces, no spaces at
+    # the ends), but the candidates are found by one finditer() pass in C.
+    # Python only looks at the candidates, to drop end words that would
+    # start a sentence (the "at least 2 words" part of Rule 2)
+    def segment_regex(self, cleaned_text):
+        sentences = []
+        start = 0
+        for match in self.boundary_pattern.finditer(cleaned_text):
+            word = match.group('end')
+            if word is not None and match.start() == start and not word.endswith(self.punctuation):
+                continue
+            sentences.append(cleaned_text[start:match.end()])
+            start = match.end() + 1
+            
+        if start < len(cleaned_text):
+            sentences.append(cleaned_text[start:])
+        return sentences
+
+
+# the default rules, built from the lists above
+DEFAULT_RULES = BoundaryRules()
+
+
+# splits cleaned text into sentences with the given rules (default: the lists above)
+def segment_sentences(cleaned_text, rules=None):
+    return (rules or DEFAULT_RULES).segment(cleaned_text)
 
 
 # ===================================================================== #
 # STEP 5:  EVALUATION
 # ===================================================================== #
-# function to calculate accuracy, precision, etc.:
-def eval_function(gold_standard, predicted_sentences):
+# the numbers eval_function() and evaluate_files() hand back
+@dataclass
+class SegmentationMetrics:
+    gold_total: int
+    predicted_total: int
+    tp: int
+    fp: int
+    fn: int
+    accuracy: float
+    precision: float
+    recall: float
+    f1_score: float
+
+    # works out the ratios from the three counts
+    @classmethod
+    def from_counts(cls, tp, gold_total, predicted_total):
+        # fp = predicted lines that are wrong, fn = gold lines i missed
+        fp = predicted_total - tp
+        fn = gold_total - tp
+        
+        total_unique_sentences = tp + fp + fn
+        accuracy = tp / total_unique_sentences if total_unique_sentences > 0 else 0.0
+        precision = tp / predicted_total if predicted_total > 0 else 0.0
+        recall = tp / gold_total if gold_total > 0 else 0.0
+        
+        # f1 check (prevent division by 0)
+        if (precision + recall) > 0:
+            f1_score = 2 * (precision * recall) / (precision + recall)
+        else:
+            f1_score = 0.0
+            
+        return cls(gold_total, predicted_total, tp, fp, fn, accuracy, precision, recall, f1_score)
 
-    # copying lists so i can remove matched items without messing up the original loop
-    gold_pool = list(gold_standard)
+    def to_json(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(asdict(self), f, indent=2)
+            f.write('\n')
+
+    def report(self):
+        print("\n==================================")
+        print("      EVALUATION METRICS          ")
+        print("==================================")
+        print(f"Gold Standard Total : {self.gold_total}")
+        print(f"Predictions Total   : {self.predicted_total}")
+        print(f"True Positives (TP) : {self.tp}")
+        print(f"False Positives (FP): {self.fp}")
+        print(f"False Negatives (FN): {self.fn}")
+        print("----------------------------------")
+        print(f"Accuracy  : {self.accuracy:.4f}")
+        print(f"Precision : {self.precision:.4f}")
+        print(f"Recall    : {self.recall:.4f}")
+        print(f"F1-Score  : {self.f1_score:.4f}")
+        print("==================================\n")
+
+
+# function to calculate accuracy, precision, etc.:
+# a prediction counts as correct if the same sentence is in the gold
+# standard, and every gold sentence can only be matched once. The Counter
+# intersection does that matching for all sentences at once
+def eval_function(gold_standard, predicted_sentences, json_path=None, verbose=True):
+    gold = Counter(gold_standard)
+    predicted = Counter(predicted_sentences)
+    tp = sum((gold & predicted).values())
     
-    tp = 0 # correct predictions
-    for pred in predicted_sentences:
-        if pred in gold_pool:
+    metrics = SegmentationMetrics.from_counts(tp, sum(gold.values()), sum(predicted.values()))
+    if verbose:
+        metrics.report()
+    if json_path:
+        metrics.to_json(json_path)
+    return metrics
+
 
+# reads a one-sentence-per-line file lazily, with the whitespace cleaned the
+# same way preprocess_urdu_text() does it (normalize_urdu_text() with
+# normalize=True), skipping blank lines
+def iter_line_sentences(file_path, normalize=False):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if normalize:
+                line = fold_urdu_text(line)
+            sentence = ' '.join(line.split())
+            if sentence:
+                yield sentence
+
+
+# (start, end) word offsets of each sentence in the text they split up
+def sentence_spans(sentences):
+    start = 0
+    for sentence in sentences:
+        end = start + len(sentence.split(' '))
+        yield start, end
+        start = end
+
+
+# positional matching: a prediction is correct if it starts and ends at the
+# same word offsets as a gold sentence. Both streams are walked side by side
+# in one pass, so nothing is kept in memory. Both sides have to be
+# segmentations of the same text for this to make sense
+def count_positional(gold_sentences, predicted_sentences):
+    gold = sentence_spans(gold_sentences)
+    predicted = sentence_spans(predicted_sentences)
+    tp = gold_total = predicted_total = 0
+    
+    g = next(gold, None)
+    p = next(predicted, None)
+    while g is not None and p is not None:
+        if g == p:
             tp += 1
-            gold_pool.remove(pred) # removed so it doesn't double count
+        # move on whichever sentence finishes first (both if they end together)
+        g_end, p_end = g[1], p[1]
+        if g_end <= p_end:
+            gold_total += 1
+            g = next(gold, None)
+        if p_end <= g_end:
+            predicted_total += 1
+            p = next(predicted, None)
             
-    # fp = predicted lines that are wrong
-    fp = len(predicted_sentences) - tp 
+    gold_total += (g is not None) + sum(1 for _ in gold)
+    predicted_total += (p is not None) + sum(1 for _ in predicted)
+    return tp, gold_total, predicted_total
+
+
+# evaluates a predicted sentence file against a gold file (one sentence per
+# line each) without loading either one into a list. By default the scoring
+# is the same as eval_function(), which keeps a Counter of the distinct gold
+# sentences; positional=True matches on word offsets in constant memory.
+# normalize=True normalizes both files before comparing
+def evaluate_files(gold_path, predicted_path, positional=False, json_path=None, verbose=True, normalize=False):
+    if positional:
+        tp, gold_total, predicted_total = count_positional(
+            iter_line_sentences(gold_path, normalize), iter_line_sentences(predicted_path, normalize))
+    else:
+        gold = Counter(iter_line_sentences(gold_path, normalize))
+        gold_total = sum(gold.values())
+        tp = predicted_total = 0
+        for sentence in iter_line_sentences(predicted_path, normalize):
+            predicted_total += 1
+            if gold[sentence] > 0:
+                gold[sentence] -= 1
+                tp += 1
+                
+    metrics = SegmentationMetrics.from_counts(tp, gold_total, predicted_total)
+    if verbose:
+        metrics.report()
+    if json_path:
+        metrics.to_json(json_path)
+    return metrics
+
+
+# ===================================================================== #
+# STEP 6: STREAMING BIG FILES
+# ===================================================================== #
+# read_urdu_text() + preprocess_urdu_text() + segment_sentences() keep the
+# whole corpus in memory a few times over, which is fine for the sample
+# file but not for a multi-GB dump. These generators do the same job in
+# chunks: memory stays at one chunk plus the sentence being built.
+
+# how much text to read per step
+CHUNK_SIZE = 1 << 20
+
+# yields the words of a text stream one by one, reading it in chunks.
+# str.split() with no argument drops every kind of whitespace, which is the
+# same thing \s+ -> ' ' followed by split(' ') does on the cleaned text.
+# normalize=True runs the chunks through fold_urdu_text() first
+def iter_words(stream, chunk_size=CHUNK_SIZE, normalize=False):
+    if normalize:
+        chunks = iter_folded(stream, chunk_size)
+    else:
+        chunks = iter(lambda: stream.read(chunk_size), "")
+    tail = ""
+    for chunk in chunks:
+        chunk = tail + chunk
+        words = chunk.split()
+        
+        # a word cut in half by the chunk edge waits for the next chunk
+        if words and not chunk[-1].isspace():
+            tail = words.pop()
+        else:
+            tail = ""
+        yield from words
+        
+    if tail:
+        yield tail
+
+
+# same rules as segment_sentences(), but fed one word at a time.
+# a word is only decided once the word after it has been read, since
+# Rule 2 needs to look ahead at it
+def iter_sentences(words, rules=None):
+    rules = rules or DEFAULT_RULES
+    if not isinstance(rules, BoundaryRules):
+        yield from iter_scored_sentences(words, rules)
+        return
+    punctuation = rules.punctuation
+    end = rules.end_words
+    continuation = rules.continuation_words
     
-    # fn = lines from gold standard i missed
-    fn = len(gold_standard) - tp 
+    words = iter(words)
+    current_sentence = []
     
-    # calculating the metrics
-    total_unique_sentences = tp + fp + fn
-    accuracy = tp / total_unique_sentences if total_unique_sentences > 0 else 0.0
+    word = next(words, None)
+    while word is not None:
+        next_word = next(words, None)
+        current_sentence.append(word)
+        
+        # rules.is_boundary() spelled out, it's the hot loop
+        if word.endswith(punctuation) or (
+                word in end and len(current_sentence) >= 2
+                and (next_word is None or next_word in continuation)):
+            yield ' '.join(current_sentence)
+            current_sentence = []
+            
+        word = next_word
+        
+    if current_sentence:
+        yield ' '.join(current_sentence)
 
-    precision = tp / len(predicted_sentences) if len(predicted_sentences) > 0 else 0.0
-    
-    recall = tp / len(gold_standard) if len(gold_standard) > 0 else 0.0
+
+# iter_sentences() for rules that have no word lists to spell out (like
+# urdu_lexicon.LexiconRules): every word goes through rules.is_boundary()
+def iter_scored_sentences(words, rules):
+    is_boundary = rules.is_boundary
+    words = iter(words)
+    current_sentence = []
     
-    # f1 check (prevent division by 0)
-    if (precision + recall) > 0:
+    word = next(words, None)
+    while word is not None:
+        next_word = next(words, None)
+        current_sentence.append(word)
+        if is_boundary(word, next_word, len(current_sentence)):
+            yield ' '.join(current_sentence)
+            current_sentence = []
+        word = next_word
+        
+    if current_sentence:
+        yield ' '.join(current_sentence)
+
+
+# the whole pipeline for a file on disk: gives the same sentences as
+# segment_sentences(preprocess_urdu_text(read_urdu_text(path))), or with
+# normalize_urdu_text() in place of preprocess_urdu_text() if normalize=True
+def iter_file_sentences(file_path, chunk_size=CHUNK_SIZE, rules=None, normalize=False):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        yield from iter_sentences(iter_words(f, chunk_size, normalize), rules)
+
+
+# writes one sentence per line, returns how many were written
+def write_sentences(sentences, out):
+    count = 0
+    for sentence in sentences:
+        out.write(sentence)
+        out.write('\n')
+        count += 1
+    return count
+
+
+# ===================================================================== #
+# STEP 7: PARALLEL CORPUS MODE
+# ===================================================================== #
+# A corpus is a directory, a glob, or a single file. Every file is cut into
+# byte-range shards and the shards are segmented on a process pool. Each
+# file is its own text, so a sentence never runs from one file into the next.
+
+# bytes per shard handed to a worker
+SHARD_SIZE = 16 << 20
+
+# ascii whitespace; utf-8 never uses these bytes inside a multi-byte letter,
+# so cutting right after one can't split a character or a word
+SPACE_BYTE = re.compile(rb'[ \t\n\r\x0b\x0c]')
+
+
+# turns a directory / glob / file name into a sorted list of files
+def corpus_files(source):
+    if os.path.isdir(source):
+        names = (os.path.join(source, name) for name in os.listdir(source))
+        return sorted(name for name in names if os.path.isfile(name))
+    if os.path.isfile(source):
+        return [source]
+    return sorted(name for name in glob.glob(source) if os.path.isfile(name))
+
+
+# splits one file into (path, start, end) byte ranges of about shard_size,
+# each one ending just after a whitespace byte
+def plan_shards(file_path, shard_size=SHARD_SIZE):
+    size = os.path.getsize(file_path)
+    shards = []
+    start = 0
+    with open(file_path, 'rb') as f:
+        while start < size:
+            end = min(start + shard_size, size)
+            
+            # walk forward to the next whitespace byte
+            f.seek(end)
+            while end < size:
+                block = f.read(1 << 16)
+                found = SPACE_BYTE.search(block)
+                if found:
+                    end += found.end()
+                    break
+                end += len(block)
+                
+            shards.append((file_path, start, end))
+            start = end
+    return shards
 
-        f1_score = 2 * (precision * recall) / (precision + recall)
+
+# indices of the words that end a sentence, from (word, next_word) pairs.
+# carry is how many words of the sentence came before the first pair
+def boundary_indices(pairs, carry=0, rules=None):
+    is_boundary = (rules or DEFAULT_RULES).is_boundary
+    length = carry
+    for i, (word, next_word) in enumerate(pairs):
+        length += 1
+        if is_boundary(word, next_word, length):
+            yield i
+            length = 0
+
+
+# worker side: segments one shard as far as it can on its own.
+#
+# A shard doesn't know how many words the previous shard left unfinished,
+# but Rule 2 only cares whether that is none or some (length >= 2). So the
+# shard is scanned both ways, and from the first boundary the two scans
+# agree on, everything after is the same whatever came before. The words up
+# to that point (head) go back to the parent to be finished with the real
+# carry. The last word's next word is in the following shard, so the words
+# after the last boundary (tail) go back unfinished as well.
+#
+# returns (head, word after head, sentences, tail); if the scans never
+# agree the whole shard is head and the word after it is None
+def segment_shard(shard, rules=None, normalize=False):
+    file_path, start, end = shard
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    if normalize:
+        text = fold_urdu_text(text)
+    words = text.split()
+        
+    pairs = list(zip(words, words[1:]))
+    cuts = boundary_indices(pairs, rules=rules)
+    
+    # both scans only differ for the first few words, so the carried one
+    # stops as soon as they meet
+    carried = boundary_indices(pairs, carry=1, rules=rules)
+    agreed = next(carried, None)
+    for i in cuts:
+        while agreed is not None and agreed < i:
+            agreed = next(carried, None)
+        if agreed == i:
+            break
     else:
+        return words, None, [], []
+        
+    sentences = []
+    begin = agreed + 1
+    for i in cuts:
+        sentences.append(' '.join(words[begin:i + 1]))
+        begin = i + 1
+    return words[:agreed + 1], words[agreed + 1], sentences, words[begin:]
+
+
+# parent side: stitches a file's shard results back together in order
+def merge_shards(results, rules=None):
+    pending = []
+    for head, after, sentences, tail in results:
+        pending.extend(head)
+        if after is None:
+            continue
+            
+        # pending now ends on a boundary, so it closes off completely
+        begin = 0
+        for i in boundary_indices(zip(pending, pending[1:] + [after]), rules=rules):
+            yield ' '.join(pending[begin:i + 1])
+            begin = i + 1
+            
+        yield from sentences
+        pending = tail
+        
+    yield from iter_sentences(pending, rules)
+
+
+# runs segment_shard over the shards on the pool and yields the results in
+# order, with at most `window` shards in flight at once
+def shard_results(pool, shards, window, rules=None, normalize=False):
+    in_flight = deque()
+    for shard in shards:
+        in_flight.append(pool.submit(segment_shard, shard, rules, normalize))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+# segments a whole corpus on a process pool and yields the sentences in
+# file order. Only a couple of shards per worker are in flight, so memory
+# doesn't grow with the corpus
+def segment_corpus(source, workers=None, shard_size=SHARD_SIZE, rules=None, normalize=False):
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for file_path in corpus_files(source):
+            shards = plan_shards(file_path, shard_size)
+            results = shard_results(pool, shards, 2 * workers, rules, normalize)
+            yield from merge_shards(results, rules)
+
+
+# total size of a corpus in bytes, for throughput numbers
+def corpus_bytes(source):
+    return sum(os.path.getsize(name) for name in corpus_files(source))
+
+
+# ===================================================================== #
+# STEP 8: MEMORY-MAPPED READER
+# ===================================================================== #
+# Works on the raw utf-8 bytes of a file through mmap, so the corpus is
+# never decoded or copied as a whole. Sentences come out as (start, end)
+# byte offsets into the file and are only turned into text on request.
+
+# one word: a run of bytes that aren't whitespace. These are the utf-8
+# encodings of every character str.split() treats as whitespace; Urdu
+# letters (lead bytes d8-db) go through the first, cheap branch. A word
+# can't start on a continuation byte (80-bf), which keeps the tail of a
+# multi-byte space from passing for a word
+WORD_BYTES = re.compile(
+    rb'(?=[^\x80-\xbf])(?:[^\t-\r\x1c-\x20\xc2\xe1\xe2\xe3]+'
+    rb'|\xc2(?![\x85\xa0])'
+    rb'|\xe1(?!\x9a\x80)'
+    rb'|\xe2(?!\x80[\x80-\x8a\xa8\xa9\xaf]|\x81\x9f)'
+    rb'|\xe3(?!\x80\x80))+'
+)
 
-        f1_score = 0.0
+
+class MappedCorpus:
+
+    def __init__(self, file_path, rules=None):
+        rules = rules or DEFAULT_RULES
+        if not isinstance(rules, BoundaryRules):
+            raise TypeError("MappedCorpus compares bytes against word lists, it needs BoundaryRules")
+        # the rules, encoded so they compare against bytes. endswith() on the
+        # encoded punctuation is safe: a utf-8 suffix can only match whole
+        # characters
+        self.punctuation = tuple(punct.encode('utf-8') for punct in rules.punctuation)
+        self.end_words = frozenset(word.encode('utf-8') for word in rules.end_words)
+        self.continuation_words = frozenset(word.encode('utf-8') for word in rules.continuation_words)
         
-    print("\n==================================")
-    print("      EVALUATION METRICS          ")
-    print("==================================")
-    print(f"Gold Standard Total : {len(gold_standard)}")
-    print(f"Predictions Total   : {len(predicted_sentences)}")
-    print(f"True Positives (TP) : {tp}")
-    print(f"False Positives (FP): {fp}")
-    print(f"False Negatives (FN): {fn}")
-    print("----------------------------------")
-    print(f"Accuracy  : {accuracy:.4f}")
-    print(f"Precision : {precision:.4f}")
-    print(f"Recall    : {recall:.4f}")
-    print(f"F1-Score  : {f1_score:.4f}")
-    print("==================================\n")
+        self.file = open(file_path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        # an empty file can't be mapped, an empty bytes object does the same job
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # (start, end) byte offsets of every sentence: start of its first word,
+    # end of its last word. Same rules as iter_sentences(); a word is
+    # decided one step late, once the word after it has been matched
+    def spans(self):
+        punctuation = self.punctuation
+        end_words = self.end_words
+        continuation_words = self.continuation_words
+        
+        start = None
+        length = 0
+        word = None
+        word_end = 0
+        for match in WORD_BYTES.finditer(self.data):
+            next_word = match.group()
+            if word is not None and (word.endswith(punctuation) or (
+                    word in end_words and length >= 2 and next_word in continuation_words)):
+                yield start, word_end
+                start = None
+                length = 0
+                
+            if start is None:
+                start = match.start()
+            length += 1
+            word = next_word
+            word_end = match.end()
+            
+        # the last word has no next word, so an end word always closes it
+        if start is not None:
+            yield start, word_end
+
+    # the sentence text for a span, with whitespace collapsed the way
+    # preprocess_urdu_text() does it
+    def text(self, span):
+        start, end = span
+        return ' '.join(self.data[start:end].decode('utf-8').split())
+
+    def sentences(self):
+        for span in self.spans():
+            yield self.text(span)
+
+
+# MappedCorpus for a file on disk, closed once the sentences run out
+def iter_mapped_sentences(file_path, rules=None):
+    with MappedCorpus(file_path, rules) as corpus:
+        yield from corpus.sentences()
+
+
+# ===================================================================== #
+# STEP 9: LIVE STREAMS
+# ===================================================================== #
+# For text that turns up a bit at a time (chat messages, a log tail) there
+# is no file to read. UrduSegmenter keeps the state between calls instead:
+# the words of the sentence being built, the last word (its fate depends
+# on the word after it, Rule 2), and the start of a word that a piece of
+# text ended in the middle of. Each feed() only looks at the new text.
+#
+#   segmenter = UrduSegmenter()
+#   for message in messages:
+#       for sentence in segmenter.feed(message):
+#           ...
+#   leftover = segmenter.flush()
+#
+# The sentences come out the same as segment_sentences() gives for
+# preprocess_urdu_text() of all the text joined together (or
+# normalize_urdu_text() with normalize=True).
+class UrduSegmenter:
+
+    def __init__(self, rules=None, normalize=False):
+        self.rules = rules or DEFAULT_RULES
+        self.normalize = normalize
+        self.current_sentence = []
+        self.pending_word = None
+        self.partial_word = ""
+
+    # takes the next piece of text and returns the sentences it finished.
+    # A piece can stop in the middle of a word; the rest of the word is
+    # expected in the next piece
+    def feed(self, text):
+        if self.partial_word:
+            # the word it continues may end in a consonant that a ه at the
+            # start of this piece aspirates, so they're folded together
+            text = self.partial_word + text
+        if self.normalize:
+            text = fold_urdu_text(text)
+        if not text:
+            return []
+        words = text.split()
+        if words and not text[-1].isspace():
+            self.partial_word = words.pop()
+        else:
+            self.partial_word = ""
+        return self._advance(words)
+
+    # the end of the stream: returns the sentences still open and resets
+    # the segmenter for the next stream
+    def flush(self):
+        sentences = self._advance([self.partial_word] if self.partial_word else [])
+
+        # the last word has no next word, which is what Rule 2 wants
+        if self.pending_word is not None:
+            self.current_sentence.append(self.pending_word)
+        if self.current_sentence:
+            sentences.append(' '.join(self.current_sentence))
+
+        self.current_sentence = []
+        self.pending_word = None
+        self.partial_word = ""
+        return sentences
+
+    # decides every word that now has a word after it; the last one waits
+    def _advance(self, words):
+        rules = self.rules
+        current_sentence = self.current_sentence
+        sentences = []
+        word = self.pending_word
+
+        # rules without word lists go through is_boundary(), see
+        # iter_scored_sentences()
+        if not isinstance(rules, BoundaryRules):
+            is_boundary = rules.is_boundary
+            for next_word in words:
+                if word is not None:
+                    current_sentence.append(word)
+                    if is_boundary(word, next_word, len(current_sentence)):
+                        sentences.append(' '.join(current_sentence))
+                        current_sentence = []
+                word = next_word
+        else:
+            punctuation = rules.punctuation
+            end = rules.end_words
+            continuation = rules.continuation_words
+            for next_word in words:
+                if word is not None:
+                    current_sentence.append(word)
+                    if word.endswith(punctuation) or (
+                            word in end and len(current_sentence) >= 2 and next_word in continuation):
+                        sentences.append(' '.join(current_sentence))
+                        current_sentence = []
+                word = next_word
+
+        self.current_sentence = current_sentence
+        self.pending_word = word
+        return sentences
 
 
 # ===================================================================== #
 # MAIN EXECUTION 
 # ===================================================================== #
-if __name__ == "__main__":
+# the original walkthrough on the sample file, printing every step
+def run_demo(file_name="urdu-corpus portion.txt"):
     print("\n--- Running Segmentation ---\n")
     
     # 1. Read the file
-    file_name = "urdu-corpus portion.txt"
     raw_text = read_urdu_text(file_name)
     
     print("[1] Raw text:")
@@ -199,9 +940,8 @@ if __name__ == "__main__":
     # 5. Evaluate
     # reading the original file lines to use as the true reference for grading
     if os.path.exists(file_name):
-        with open(file_name, 'r', encoding='utf-8') as f:
-            # running the regex here too so spaces match exactly with our predictions
-            gold_standard = [re.sub(r'\s+', ' ', line).strip() for line in f if line.strip()]
+        # cleaning the lines too so spaces match exactly with our predictions
+        gold_standard = list(iter_line_sentences(file_name))
     else:
         # fallback lines for testing with the dummy string
         gold_standard = [
@@ -213,3 +953,70 @@ if __name__ == "__main__":
     
     # Run the grader
     eval_function(gold_standard=gold_standard, predicted_sentences=predicted_sentences)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rule-based Urdu sentence segmentation")
+    parser.add_argument("input", nargs="?",
+                        help="corpus file to segment in streaming mode (leave out to run the demo)")
+    parser.add_argument("--out", help="where to write one sentence per line (default: stdout)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="characters read per step in streaming mode")
+    parser.add_argument("--workers", type=int,
+                        help="segment on a process pool with this many workers (default for directories and globs: all cores)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE >> 20,
+                        help="MB of a file handed to one worker at a time")
+    parser.add_argument("--mmap", action="store_true",
+                        help="read a single file through mmap instead of in chunks")
+    parser.add_argument("--evaluate", nargs=2, metavar=("GOLD", "PREDICTED"),
+                        help="score a predicted sentence file against a gold one (one sentence per line each)")
+    parser.add_argument("--positional", action="store_true",
+                        help="with --evaluate: match sentences by word offsets, in constant memory")
+    parser.add_argument("--json", help="with --evaluate: also write the metrics to this JSON file")
+    parser.add_argument("--normalize", action="store_true",
+                        help="fold arabic/urdu letter variants and strip aerab and zero-width characters first")
+    parser.add_argument("--lexicon", help="decide boundaries with a table trained by urdu_lexicon.py instead of the word lists")
+    args = parser.parse_args()
+
+    if args.evaluate:
+        evaluate_files(*args.evaluate, positional=args.positional, json_path=args.json, normalize=args.normalize)
+        sys.exit()
+    if args.input is None:
+        run_demo()
+        sys.exit()
+
+    rules = None
+    if args.lexicon:
+        import urdu_lexicon
+        try:
+            rules = urdu_lexicon.load_rules(args.lexicon)
+        except (OSError, urdu_lexicon.LexiconError) as error:
+            parser.error(str(error))
+
+    parallel = args.workers is not None or not os.path.isfile(args.input)
+    if parallel:
+        if not corpus_files(args.input):
+            parser.error(f"no files found for {args.input!r}")
+        sentences = segment_corpus(args.input, args.workers, args.shard_size << 20, rules, normalize=args.normalize)
+    elif args.mmap:
+        # the mapped reader never decodes the text, so there's nothing to
+        # translate, and it only knows the word lists
+        if args.normalize or args.lexicon:
+            parser.error("--normalize and --lexicon can't be combined with --mmap")
+        sentences = iter_mapped_sentences(args.input)
+    else:
+        sentences = iter_file_sentences(args.input, args.chunk_size, rules, normalize=args.normalize)
+
+    start = time.perf_counter()
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as out:
+            total = write_sentences(sentences, out)
+    else:
+        sys.stdout.reconfigure(encoding='utf-8')
+        total = write_sentences(sentences, sys.stdout)
+    elapsed = time.perf_counter() - start
+
+    megabytes = corpus_bytes(args.input) / 1e6
+    workers = (args.workers or os.cpu_count()) if parallel else 1
+    print(f"{total} sentences from {megabytes:.1f} MB in {elapsed:.2f}s with {workers} worker(s): "
+          f"{megabytes / elapsed:.1f} MB/s, {total / elapsed:,.0f} sentences/s", file=sys.stderr)